@@ -0,0 +1,148 @@
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time as timer
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+LAB2_DIR = os.path.join(REPO_DIR, 'lab2')
+# the workloads import the lab2 modules, as the lab2 scripts do
+sys.path[:0] = [REPO_DIR, LAB2_DIR]
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+# Runs the workloads of workloads.py, each one in a new process, and records for
+# each of them the wall time, the events per second, the peak resident set
+# size of the process and, in a separate run with tracemalloc, the peak of the
+# memory allocated by Python and the net number of memory blocks per event:
+# the blocks still allocated at the end, minus the ones allocated at the
+# beginning. It shows the memory retained by a workload (e.g. its history), not
+# how many allocations it made: the blocks allocated and freed during the run
+# don't count, and a release build of CPython has no counter of them.
+# The FES backends (utils.events.FES_BACKENDS and the queue.PriorityQueue of the
+# original loops) are compared on the task4 workloads, and on the hold model
+# for small and large fleets.
+# The results are saved as JSON, together with a description of the machine:
+# only the results of runs on the same machine can be compared.
+
+# Control plane
+WORKLOADS = ['lab1_mm1', 'lab1_task3_policies', 'lab2_task1_pipeline', 'lab2_task4_configurations',
+             'lab2_task4_configurations_calendar', 'lab2_task4_configurations_priority_queue',
+             'hold_heap_10_drones', 'hold_calendar_10_drones', 'hold_heap_1000_drones', 'hold_calendar_1000_drones']
+REPETITIONS = 3  # the best wall time is kept
+TRACE_ALLOCATIONS = True
+RESULTS_PATH = os.path.join(BENCHMARKS_DIR, 'results', timer.strftime('%Y%m%d-%H%M%S') + '.json')
+BASELINE_PATH = None  # results of a previous run, to compare with
+
+
+def _measure(name, trace_allocations):
+    # run in a new process: the lab2 variables are loaded relative to the lab2 folder, while the files written
+    # by the workloads go to a temporary folder
+    os.chdir(LAB2_DIR)
+    import workloads
+    workload = workloads.WORKLOADS[name]
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        os.mkdir('report_images')
+        if trace_allocations:
+            tracemalloc.start()
+        blocks = sys.getallocatedblocks()
+        start = timer.perf_counter()
+        events = workload()
+        wall_time = timer.perf_counter() - start
+        result = {
+            'events': events,
+            'wall_time': wall_time,
+            # kilobytes on Linux
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        }
+        if trace_allocations:
+            result['traced_peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            result['net_blocks_per_event'] = (sys.getallocatedblocks() - blocks) / events
+            tracemalloc.stop()
+        os.chdir(LAB2_DIR)
+    return result
+
+
+def run_workload(executor, name):
+    runs = [executor.submit(_measure, name, False).result() for _ in range(REPETITIONS)]
+    best = min(runs, key=lambda run: run['wall_time'])
+    result = {
+        'events': best['events'],
+        'wall_time': best['wall_time'],
+        'events_per_sec': best['events'] / best['wall_time'],
+        'peak_rss_mb': max(run['peak_rss_mb'] for run in runs)
+    }
+    if TRACE_ALLOCATIONS:
+        traced = executor.submit(_measure, name, True).result()
+        result['traced_peak_mb'] = traced['traced_peak_mb']
+        result['net_blocks_per_event'] = traced['net_blocks_per_event']
+    return result
+
+
+def machine_info():
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version()
+    }
+
+
+def print_results(results):
+    print('{:<42s}{:>12s}{:>12s}{:>14s}{:>14s}{:>14s}{:>16s}'.format(
+        'Workload', 'Events', 'Wall [s]', 'Events/s', 'Peak RSS [MB]', 'Traced [MB]', 'Net blocks/ev'))
+    for name, result in results.items():
+        print('{:<42s}{:>12d}{:>12.3f}{:>14.0f}{:>14.1f}{:>14.1f}{:>16.4f}'.format(
+            name, result['events'], result['wall_time'], result['events_per_sec'], result['peak_rss_mb'],
+            result.get('traced_peak_mb', float('nan')), result.get('net_blocks_per_event', float('nan'))))
+
+
+def compare(baseline, results):
+    """
+    Prints the relative change of each metric with respect to the baseline
+    (negative is better for all of them, but the events per second).
+    """
+    if baseline['machine'] != results['machine']:
+        print('Warning: the baseline was recorded on a different machine, the results are not comparable.')
+    metrics = ['wall_time', 'events_per_sec', 'peak_rss_mb', 'traced_peak_mb', 'net_blocks_per_event']
+    print('{:<42s}'.format('Change vs baseline') + ''.join('{:>16s}'.format(metric[:15]) for metric in metrics))
+    for name, result in results['workloads'].items():
+        previous = baseline['workloads'].get(name)
+        if previous is None:
+            continue
+        if previous['events'] != result['events']:
+            print('Warning: {:s} processed {:d} events instead of {:d}.'.format(
+                name, result['events'], previous['events']))
+        changes = []
+        for metric in metrics:
+            if metric in result and metric in previous and previous[metric]:
+                changes.append('{:>+15.1f}%'.format((result[metric] / previous[metric] - 1) * 100))
+            else:
+                changes.append('{:>16s}'.format('-'))
+        print('{:<42s}'.format(name) + ''.join(changes))
+
+
+if __name__ == '__main__':
+    results = {'machine': machine_info(), 'workloads': {}}
+    # a new process for each run, so that the peak RSS is the one of the run
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                             max_tasks_per_child=1) as executor:
+        for name in WORKLOADS:
+            print('Running {:s}...'.format(name))
+            results['workloads'][name] = run_workload(executor, name)
+    print_results(results['workloads'])
+
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    with open(RESULTS_PATH, 'w') as json_file:
+        json.dump(results, json_file, indent=4)
+    print('Results saved to', RESULTS_PATH)
+
+    if BASELINE_PATH is not None:
+        with open(BASELINE_PATH) as json_file:
+            compare(json.load(json_file), results)
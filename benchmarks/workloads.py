@@ -0,0 +1,203 @@
+import importlib.util
+import os
+import random
+from functools import partial
+from queue import PriorityQueue
+
+import task4
+from lab2 import (Event, SimulationContext, Simulator, detect_steady_state_slots, load_variables,
+                  start_working_intervals)
+from utils.events import FES_BACKENDS
+from utils.measurements import FilteredMeasurements, Measurement
+from utils.queues import MMmB, Packet
+from utils.random_streams import RandomStream
+
+# Canonical workloads of the benchmark suite (see run_benchmarks.py). Each one
+# runs the same simulations from scratch, always with the same seeds, and
+# returns the number of events it processed.
+# They must be imported with the lab2 folder as the working directory, since
+# the lab2 variables are loaded from "variables.json".
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# lab1 queueMM1-ES: M/M/1 with a finite buffer
+MM1_SERVICE = 20.0
+MM1_ARRIVAL = 1.0
+MM1_BUFFER_SIZE = 100
+MM1_SIM_TIME = 500000
+
+TASK1_VARIABLES = load_variables('TASK1')
+# a single pipeline processes about 1200 events: it is repeated, with different seeds, to take long enough to be timed
+TASK1_PIPELINE_REPETITIONS = 100
+TASK4_CONFIGURATIONS = ['I', 'II', 'III', 'IV', 'V', 'VI']
+TASK4_WORKING_SCHEDULING = 'II'
+
+# Hold model: synthetic fleets of drones whose antennas are always busy, so that the FES always holds one pending
+# event per antenna, for each FES backend
+HOLD_FLEET_SIZES = [10, 1000]
+HOLD_EVENTS = 200000
+
+
+def _load_lab1_module(name):
+    # the lab1 scripts are not a package, and their names clash with the lab2 ones
+    spec = importlib.util.spec_from_file_location('lab1_' + name, os.path.join(REPO_DIR, 'lab1', name + '.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def lab1_mm1():
+    """
+    The M/M/1 of lab1 queueMM1-ES, with the PriorityQueue event loop of the
+    lab1 scripts. The script itself can't be imported, since it still uses
+    the old Statistics counters, so its loop is reproduced here on
+    Measurement.
+    """
+    rng = random.Random(42)
+    queue = MMmB(power_supply="INF", service_times=[MM1_SERVICE], buffer_size=MM1_BUFFER_SIZE)
+    data = Measurement()
+    FES = PriorityQueue()
+    FES.put((0, "arrival", None))
+    time = 0
+    users = 0
+    events = 0
+    while time < MM1_SIM_TIME:
+        (time, event_type, server_id) = FES.get()
+        events += 1
+        data.average_users += users * (time - data.time)
+        data.time = time
+        if event_type == "arrival":
+            data.arrivals += 1
+            if queue.is_queue_full():
+                data.losses += 1
+            else:
+                users += 1
+                queue.insert(Packet(arrival_time=time))
+            FES.put((time + rng.expovariate(1.0 / MM1_ARRIVAL), "arrival", None))
+        else:
+            client = queue.consume(server_id)
+            data.departures += 1
+            data.delay += time - client.arrival_time
+            users -= 1
+        if queue.can_engage_server():
+            (s_id, s_service_time) = queue.engage_server()
+            FES.put((time + rng.expovariate(1.0 / s_service_time), "departure", s_id))
+    return events
+
+
+def lab1_task3_policies():
+    """
+    lab1 task3: the multi-antenna drone with each scheduling policy.
+    """
+    task3 = _load_lab1_module('task3')
+    random.seed(42)
+    events = 0
+    for policy in task3.policies:
+        data, _ = task3.run_simulation(policy)
+        events += data.arrivals + data.departures
+    return events
+
+
+def lab2_task1_pipeline():
+    """
+    lab2 task1_pipeline: a simulation of the TASK1 drone for each working
+    slot, followed by the detection of its steady state, repeated
+    TASK1_PIPELINE_REPETITIONS times.
+    """
+    variables = TASK1_VARIABLES
+    drone = variables['drone_types']['A']
+    buffer_size = variables['BASE_BUFFER_SIZE'] * drone['BUFFER_SIZE']
+    events = 0
+    start_working_times = start_working_intervals(variables['SIM_TIME'], variables['WORKING_SCHEDULING']['V'])
+    for repetition in range(TASK1_PIPELINE_REPETITIONS):
+        for slot_counter, start_working_time in enumerate(start_working_times):
+            events += _task1_pipeline_slot(variables, drone, buffer_size, slot_counter, start_working_time,
+                                           seed=42 + repetition)
+    return events
+
+
+def _task1_pipeline_slot(variables, drone, buffer_size, slot_counter, start_working_time, seed):
+    ctx = SimulationContext(variables=variables, rng=RandomStream(seed))
+    ctx.MMms[0] = MMmB(power_supply=drone['POW'],
+                       service_times=[1 / (variables['BASE_SERVICE_RATE'] * drone['SERVICE_RATE'])],
+                       buffer_size=buffer_size,
+                       maximum_recharge_cycles=variables['RECHARGE_CONSTRAINT']['I'],
+                       working_slots=variables['WORKING_SCHEDULING']['IV'])
+    simulator = Simulator(start_time=0, ctx=ctx)
+    simulator.schedule(0, Event.ARRIVAL)
+    simulator.run(until=variables['SIM_TIME'])
+    _, steady_state_lists = detect_steady_state_slots(buffer_size, ctx.measurements)
+    FilteredMeasurements(ctx.measurements, steady_state_lists[slot_counter], start_working_time)
+    return simulator.processed_events
+
+
+def lab2_task4_configurations(backend='heap'):
+    """
+    lab2 task4: each drones configuration, with the same working scheduling,
+    on one of the FES_BACKENDS or, with backend='priority_queue', on the
+    queue.PriorityQueue FES of the original loops.
+    """
+    variables = task4.variables
+    events = 0
+    for configuration in TASK4_CONFIGURATIONS:
+        ctx = SimulationContext(variables=variables)
+        ctx.reset(seed=0, common_random_numbers=task4.COMMON_RANDOM_NUMBERS)
+        for i, drone_type in enumerate(variables['configurations'][configuration]):
+            drone = variables['drone_types'][drone_type]
+            ctx.MMms[i] = MMmB(power_supply=drone['POW'],
+                               service_times=[1 / (variables['BASE_SERVICE_RATE'] * drone['SERVICE_RATE'])
+                                              for m in range(drone['m_ANTENNAS'])],
+                               buffer_size=variables['BASE_BUFFER_SIZE'] * drone['BUFFER_SIZE'],
+                               working_slots=variables['WORKING_SCHEDULING'][TASK4_WORKING_SCHEDULING])
+        if backend == 'priority_queue':
+            simulator = Simulator(FES=PriorityQueue(), start_time=variables['SIM_START'], ctx=ctx)
+        else:
+            simulator = Simulator(start_time=variables['SIM_START'], backend=backend, ctx=ctx)
+        simulator.schedule(variables['SIM_START'], Event.ARRIVAL)
+        simulator.run(until=variables['SIM_START'] + variables['SIM_TIME'])
+        events += simulator.processed_events
+    return events
+
+
+def hold_model(backend, n_drones):
+    """
+    About HOLD_EVENTS departures of a fleet of 'n_drones' drones (of the TASK4
+    drone types, in turn) on the given FES backend: each DEPARTURE schedules
+    the next one of the same antenna, so the size of the FES is constant.
+    """
+    variables = task4.variables
+    drone_types = variables['drone_types']
+    types = list(drone_types.keys())
+    service_times = {}
+    for i in range(n_drones):
+        drone = drone_types[types[i % len(types)]]
+        service_times[i] = [1 / (variables['BASE_SERVICE_RATE'] * drone['SERVICE_RATE'])
+                            for m in range(drone['m_ANTENNAS'])]
+    rng = random.Random(0)
+
+    def evt_hold_departure(ctx, time, drone_id, server_id):
+        ctx.FES.put((time + rng.expovariate(1.0 / service_times[drone_id][server_id]),
+                     Event.DEPARTURE, drone_id, server_id))
+
+    simulator = Simulator(backend=backend, ctx=SimulationContext())
+    simulator.register_handler(Event.DEPARTURE, evt_hold_departure)
+    for drone_id, times in service_times.items():
+        for server_id, service_time in enumerate(times):
+            simulator.schedule(rng.expovariate(1.0 / service_time), Event.DEPARTURE, drone_id, server_id)
+    # departures per time unit of the whole fleet
+    throughput = sum(1.0 / service_time for times in service_times.values() for service_time in times)
+    simulator.run(until=HOLD_EVENTS / throughput)
+    return simulator.processed_events
+
+
+WORKLOADS = {
+    'lab1_mm1': lab1_mm1,
+    'lab1_task3_policies': lab1_task3_policies,
+    'lab2_task1_pipeline': lab2_task1_pipeline,
+    'lab2_task4_configurations': lab2_task4_configurations,
+    'lab2_task4_configurations_calendar': partial(lab2_task4_configurations, backend='calendar'),
+    'lab2_task4_configurations_priority_queue': partial(lab2_task4_configurations, backend='priority_queue')
+}
+for _backend in FES_BACKENDS:
+    for _n_drones in HOLD_FLEET_SIZES:
+        WORKLOADS['hold_{:s}_{:d}_drones'.format(_backend, _n_drones)] = partial(hold_model, _backend, _n_drones)
@@ -1,33 +1,6 @@
-import math
-from scipy.stats import t
 import matplotlib.pyplot as plt
 import numpy as np
-
-
-def compute_variance(sample):
-    sample_size = len(sample)
-    sample_mean = sum(sample) / sample_size
-    variance = sum((x - sample_mean) ** 2 for x in sample) / (sample_size - 1)
-    return variance
-
-
-def compute_confidence_interval(sample, confidence_level):
-    sample_size = len(sample)
-    if sample_size < 2:
-        raise ValueError("Il campione deve avere almeno due elementi per calcolare l'intervallo di confidenza.")
-
-    sample_mean = sum(sample) / sample_size
-    sample_variance = compute_variance(sample)
-    sample_std_dev = math.sqrt(sample_variance)
-
-    standard_error = sample_std_dev / math.sqrt(sample_size)
-    degrees_of_freedom = sample_size - 1
-
-    t_value = t.ppf((1 + confidence_level) / 2, degrees_of_freedom)
-    margin_of_error = t_value * standard_error
-
-    return sample_mean, sample_mean - margin_of_error, sample_mean + margin_of_error
-
+from utils.output_analysis import compute_confidence_intervals
 
 # Dati delle simulazioni per ciascun tasso di arrivo
 sample_data = {
@@ -40,29 +13,17 @@ sample_data = {
 
 confidence_level = 0.95
 
-arrival_rates = []
-means = []
-ci_lower = []
-ci_upper = []
-
-# Calcola le medie e gli intervalli di confidenza per ogni tasso di arrivo
-for arrival_rate, sample_data_arrival in sorted(sample_data.items()):
-    mean, lower, upper = compute_confidence_interval(sample_data_arrival, confidence_level)
-    arrival_rates.append(arrival_rate)
-    means.append(mean)
-    ci_lower.append(lower)
-    ci_upper.append(upper)
+# Calcola le medie e gli intervalli di confidenza di tutti i tassi di arrivo in una volta
+# (una colonna per tasso di arrivo)
+arrival_rates = np.array(sorted(sample_data.keys()))
+means, ci_lower, ci_upper = compute_confidence_intervals(
+    np.column_stack([sample_data[arrival_rate] for arrival_rate in arrival_rates]), confidence_level)
 
+for arrival_rate, mean, lower, upper in zip(arrival_rates, means, ci_lower, ci_upper):
     print(f"Tasso di Arrivo {arrival_rate}:")
     print(f"  Media: {mean}")
     print(f"  Intervallo di confidenza al {confidence_level * 100}%: ({lower}, {upper})\n")
 
-# Converti le liste in array numpy
-arrival_rates = np.array(arrival_rates)
-means = np.array(means)
-ci_lower = np.array(ci_lower)
-ci_upper = np.array(ci_upper)
-
 # Crea il grafico senza scale factor
 plt.figure(figsize=(10, 6))
 plt.plot(arrival_rates, means, 'b-', label="Mean Average Delay")
@@ -6,6 +6,8 @@ import matplotlib.pyplot as plt
 import pandas as pd
 from utils.queues import MMmB, Packet
 from utils.measurements import Measurement
+from utils.output_analysis import SequentialStopping
+from utils import analytic
 
 # Parametri di simulazione
 SERVICE = 15.0  # Tempo di servizio fisso
@@ -13,6 +15,11 @@ BUFFER_SIZE = 0  # Nessun buffer come da Task 1
 SERVICE_TIMES = [SERVICE]
 SIM_TIME = 500000  # Tempo totale di simulazione
 ARRIVAL_RATES = [0.1, 0.5, 0.9, 1.1, 1.5]  # Tassi di arrivo da testare
+# Arresto sequenziale: ogni simulazione termina appena la semiampiezza relativa dell'intervallo di confidenza della
+# probabilità di perdita scende sotto RELATIVE_PRECISION, quindi SIM_TIME è solo un limite superiore
+# (None per simulare sempre fino a SIM_TIME), ma mai prima di MIN_EVENTS eventi
+RELATIVE_PRECISION = None
+MIN_EVENTS = 200000
 
 def arrival(time, FES, queue: MMmB, arrival_rate, data: Measurement):
     global users
@@ -77,32 +84,47 @@ def departure(time, FES, queue: MMmB, server_id, data: Measurement):
 
 if __name__ == '__main__':
     random.seed(42)
+    # Valori teorici (M/M/1/0, formula di Erlang-B) per tutti i tassi di arrivo, da confrontare con la simulazione
+    theory = analytic.mmm_metrics(np.array(ARRIVAL_RATES), SERVICE, servers=len(SERVICE_TIMES),
+                                  buffer_size=BUFFER_SIZE)
     results = []
     delays = []
     loss_rates = []
     average_users_list = []
 
-    for ARRIVAL in ARRIVAL_RATES:
+    for i, ARRIVAL in enumerate(ARRIVAL_RATES):
         data = Measurement()
         FES = PriorityQueue()
         FES.put((0, "arrival", None))
         MMm = MMmB(power_supply="INF", service_times=SERVICE_TIMES, buffer_size=BUFFER_SIZE)
         users = 0
         time = 0
+        events = 0
+        stopping = None
+        if RELATIVE_PRECISION is not None:
+            stopping = SequentialStopping('loss_probability', RELATIVE_PRECISION, min_events=MIN_EVENTS)
         while not FES.empty() and time < SIM_TIME:
             time, event_type, server_id = FES.get()
             if event_type == "arrival":
                 arrival(time, FES, MMm, ARRIVAL, data)
             elif event_type == "departure":
                 departure(time, FES, MMm, server_id, data)
+            events += 1
+            if stopping is not None and events % stopping.check_every == 0 and stopping.update(data):
+                break
+        if stopping is not None:
+            print(f"Tasso di arrivo {ARRIVAL} - arresto sequenziale: {stopping.report(events)}")
         average_delay = data.delay / data.departures if data.departures > 0 else 0
         results.append({
             'Arrival Rate': ARRIVAL,
             'Arrivals': data.arrivals,
             'Departures': data.departures,
             'Avg Users': data.average_users / time if time > 0 else 0,
+            'Theory Avg Users': theory['average_users'][i],
             'Avg Delay': average_delay,
+            'Theory Avg Delay': theory['average_delay'][i],
             'Loss Rate': data.loss_probability if data.arrivals > 0 else 0,
+            'Theory Loss Rate': theory['loss_probability'][i],
             'Avg Waiting Delay': data.waiting_delay / data.departures if data.departures > 0 else 0,
             'Avg Buffer Occupancy': data.buffer_occupancy,
             'Busy Time': data.busy_time
@@ -2,6 +2,7 @@ import random
 from queue import PriorityQueue
 from utils.queues import MMmB, Packet
 from utils.measurements import Measurement
+from utils.output_analysis import BatchMeans, OverlappingBatchMeans, SpectralVariance, TimeWeightedBins
 import csv
 import logging
 import matplotlib.pyplot as plt
@@ -14,6 +15,14 @@ arrival_rates = [0.5, 0.8, 1.0, 1.2]  # Tassi di arrivo
 buffer_sizes = [float('inf'), 10, 20, 50]  # Buffer infinito e buffer di dimensioni finite
 SIM_TIME = 100000
 
+# Barre d'errore da un singolo run lungo (senza repliche indipendenti)
+CONFIDENCE_LEVEL = 0.95
+DELAY_BATCH_SIZE = 1000  # Partenze per batch (batch means sovrapposti)
+DELAY_SEGMENT_LENGTH = 2048  # Partenze per segmento (stimatore spettrale)
+USERS_BIN_WIDTH = 100  # Ampiezza dei bin della serie degli utenti (medie pesate sul tempo)
+USERS_BATCH_SIZE = 20  # Bin per batch
+USERS_SEGMENT_LENGTH = 64  # Bin per segmento
+
 # Configurazione degli scenari
 scenarios = {
     "one_drone_two_antennas": {"n_drones": 1, "antennas_per_drone": 2},
@@ -31,6 +40,23 @@ results_data = {
     'busy_time_ratio': []
 }
 
+def create_estimators(batch_size, segment_length):
+    """
+    Stimatori della varianza della media di una serie: batch means, batch means
+    sovrapposti e spettrale (Welch), tutti in forma streaming.
+    """
+    return {
+        "batch means": BatchMeans(),
+        "overlapping batch means": OverlappingBatchMeans(batch_size),
+        "spectral": SpectralVariance(segment_length)
+    }
+
+
+def add_observation(estimators, value):
+    for estimator in estimators.values():
+        estimator.add(value)
+
+
 # Evento di arrivo
 def arrival(time, FES, queue_id, data, ARRIVAL, n_drones):
     queue = MMms[queue_id]
@@ -66,6 +92,7 @@ def departure(time, FES, queue_id, server_id, data):
 
     total_delay = time - packet.arrival_time  # Ritardo totale nel sistema
     measurement.delay += total_delay
+    add_observation(delay_estimators, total_delay)
 
     if packet.start_service_time is not None:
         queue_delay = packet.start_service_time - packet.arrival_time  # Tempo in coda
@@ -84,7 +111,7 @@ def departure(time, FES, queue_id, server_id, data):
 
     # Controlla se ci sono pacchetti in attesa nella coda
     if len(queue._queue) > 0:
-        next_packet = queue._queue.pop(0)  # Estrae il prossimo pacchetto dalla coda
+        next_packet = queue._queue.popleft()  # Estrae il prossimo pacchetto dalla coda
         queue.server_packets[server_id] = next_packet  # Assegna il pacchetto al server
         next_packet.start_service_time = time  # Imposta il tempo di inizio servizio
         next_service_time = random.expovariate(1.0 / SERVICE)
@@ -125,6 +152,9 @@ if __name__ == '__main__':
                     for queue in MMms.values():
                         queue.users = 0
                         queue.server_packets = {}  # Aggiungi questa linea
+                    delay_estimators = create_estimators(DELAY_BATCH_SIZE, DELAY_SEGMENT_LENGTH)
+                    users_estimators = create_estimators(USERS_BATCH_SIZE, USERS_SEGMENT_LENGTH)
+                    users_bins = [TimeWeightedBins(USERS_BIN_WIDTH, estimator) for estimator in users_estimators.values()]
                     time = 0
                     FES = PriorityQueue()
                     # Inizializza un arrivo per ciascuna coda
@@ -132,7 +162,12 @@ if __name__ == '__main__':
                         FES.put((0, "arrival", queue_id, None))
 
                     while time < SIM_TIME:
-                        (time, event_type, queue_id, server_id) = FES.get()
+                        (event_time, event_type, queue_id, server_id) = FES.get()
+                        # Utenti nel sistema (su tutti i droni) fino a questo evento
+                        users = sum(queue.users for queue in MMms.values())
+                        for bins in users_bins:
+                            bins.add(users, event_time - time)
+                        time = event_time
                         if event_type == "arrival":
                             arrival(time, FES, queue_id, data, ARRIVAL, n_drones)
                         elif event_type == "departure":
@@ -174,6 +209,12 @@ if __name__ == '__main__':
                     print("Average buffer occupancy:", average_buffer_occupancy)
                     print("Loss probability:", loss_probability)
                     print("Busy time ratio:", busy_time_ratio)
+                    for name, estimator in delay_estimators.items():
+                        print(f"Average delay ({name}): {estimator.mean:.4f} "
+                              f"+/- {estimator.half_width(CONFIDENCE_LEVEL):.4f}")
+                    for name, estimator in users_estimators.items():
+                        print(f"Average number of users ({name}): {estimator.mean:.4f} "
+                              f"+/- {estimator.half_width(CONFIDENCE_LEVEL):.4f}")
                     print("---------------------------------------------------")
 
                     # Memorizza i dati per i grafici
@@ -1,9 +1,11 @@
-import random
 from queue import PriorityQueue
 import math
 import matplotlib.pyplot as plt
 from utils.queues import MMmB, Packet
 from utils.measurements import Measurement
+from utils.output_analysis import SequentialStopping
+from utils.random_streams import RandomStream
+from utils import analytic
 
 # Simulation Parameters
 SERVICE = 1.0  # Average service time (reasonable time units)
@@ -12,19 +14,28 @@ SERVICE_TIMES = [SERVICE]
 SIM_TIME = 50000  # Total simulation time (reduced for faster execution)
 ARRIVAL_RATE = 0.9  # Single arrival rate to test
 
+# Sequential stopping: each simulation ends as soon as the relative half-width of the confidence interval of the
+# average delay is below RELATIVE_PRECISION, so SIM_TIME is only an upper bound (None to always simulate SIM_TIME),
+# but not before MIN_EVENTS events
+RELATIVE_PRECISION = None
+MIN_EVENTS = 200000
+
+# Variates are drawn in blocks by NumPy, instead of one call to 'random' per service/arrival
+rng = RandomStream()
+
 
 # Function to generate service time based on the chosen distribution
 def generate_service_time(distribution="exponential", service_mean=SERVICE):
     if distribution == "exponential":
-        return random.expovariate(1.0 / service_mean)  # Exponential distribution
+        return rng.expovariate(1.0 / service_mean)  # Exponential distribution
     elif distribution == "uniform":
-        return random.uniform(service_mean * 0.5, service_mean * 1.5)  # Uniform distribution
+        return rng.uniform(service_mean * 0.5, service_mean * 1.5)  # Uniform distribution
     elif distribution == "normal":
-        return max(0.0, random.gauss(service_mean, service_mean * 0.2))  # Normal (Gaussian) distribution
+        return max(0.0, rng.gauss(service_mean, service_mean * 0.2))  # Normal (Gaussian) distribution
     elif distribution == "gamma":
         shape = 2.0  # Shape parameter (k)
         scale = service_mean / shape  # Mean = shape * scale
-        return random.gammavariate(shape, scale)  # Gamma distribution
+        return rng.gammavariate(shape, scale)  # Gamma distribution
     else:
         raise ValueError(f"Distribution '{distribution}' is not supported.")
 
@@ -59,7 +70,7 @@ def arrival(time, FES, queue: MMmB, arrival_rate, data: Measurement, distributio
             service_time = generate_service_time(distribution)  # Generate service time with chosen distribution
             FES.put((time + service_time, "departure", s_id))  # Departure event
 
-    inter_arrival = random.expovariate(arrival_rate)
+    inter_arrival = rng.expovariate(arrival_rate)
     FES.put((time + inter_arrival, "arrival", None))
 
 
@@ -105,22 +116,29 @@ if __name__ == '__main__':
     busy_time_ratio = []
 
     for service_distribution in service_distributions:
-        random.seed(42)
+        rng.seed(42)
         data = Measurement()
         FES = PriorityQueue()
         FES.put((0, "arrival", None))
         MMm = MMmB(power_supply="INF", service_times=SERVICE_TIMES, buffer_size=BUFFER_SIZE)
         users = 0
         time = 0
+        events = 0
+        stopping = None
+        if RELATIVE_PRECISION is not None:
+            stopping = SequentialStopping('delay', RELATIVE_PRECISION, min_events=MIN_EVENTS)
         while not FES.empty() and time < SIM_TIME:
             time, event_type, server_id = FES.get()
             if event_type == "arrival":
                 arrival(time, FES, MMm, ARRIVAL, data, distribution=service_distribution)
             elif event_type == "departure":
                 departure(time, FES, MMm, server_id, data, distribution=service_distribution)
+            events += 1
+            if stopping is not None and events % stopping.check_every == 0 and stopping.update(data):
+                break
 
         average_delay = data.delay / data.departures if data.departures > 0 else 0
-        busy_time_ratio_val = data.busy_time / SIM_TIME  # Busy time ratio calculation
+        busy_time_ratio_val = data.busy_time / time  # Busy time ratio calculation
 
         # Store results
         avg_users.append(data.average_users / time if time > 0 else 0)
@@ -128,6 +146,9 @@ if __name__ == '__main__':
         loss_probability.append(data.loss_probability if data.arrivals > 0 else 0)
         busy_time_ratio.append(busy_time_ratio_val)
 
+        # Theoretical values of the M/G/1 queue with infinite buffer (Pollaczek-Khinchine formula)
+        theory = analytic.mg1_metrics(ARRIVAL, SERVICE, analytic.service_second_moment(service_distribution, SERVICE))
+
         # Print the results for each distribution
         print(f"\nResults for Service Time Distribution = {service_distribution}:")
         print(f" - Arrival Rate: {ARRIVAL}")
@@ -136,10 +157,20 @@ if __name__ == '__main__':
         print(f" - Departures: {data.departures}")
         print(f" - Avg Users: {data.average_users / time if time > 0 else 0:.2f}")
         print(f" - Avg Delay: {average_delay:.2f}")
+        print(f" - Theory Avg Users (M/G/1, infinite buffer): {theory['average_users']:.2f}")
+        print(f" - Theory Avg Delay (M/G/1, infinite buffer): {theory['average_delay']:.2f}")
+        if service_distribution == "exponential":
+            # exact values with the finite buffer, from the birth-death chain of the M/M/1/B queue
+            theory = analytic.mmm_metrics(ARRIVAL, SERVICE, servers=len(SERVICE_TIMES), buffer_size=BUFFER_SIZE)
+            print(f" - Theory Avg Users (M/M/1/B): {theory['average_users']:.2f}")
+            print(f" - Theory Avg Delay (M/M/1/B): {theory['average_delay']:.2f}")
+            print(f" - Theory Loss Probability (M/M/1/B): {theory['loss_probability']:.4f}")
         print(f" - Loss Probability: {data.loss_probability if data.arrivals > 0 else 0:.4f}")
         print(f" - Avg Waiting Delay: {data.waiting_delay / data.departures if data.departures > 0 else 0:.2f}")
         print(f" - Avg Buffer Occupancy: {data.buffer_occupancy:.2f}")
         print(f" - Busy Time Ratio: {busy_time_ratio_val:.4f}")
+        if stopping is not None:
+            print(f" - Sequential stopping: {stopping.report(events)}")
 
     # Plot Average Users
     plt.figure()
@@ -1,3 +1,5 @@
+from bisect import bisect_right
+
 import numpy as np
 from scipy.interpolate import PchipInterpolator  # Per spline monotona
 import matplotlib.pyplot as plt
@@ -18,6 +20,109 @@ arrivals_profile = pchip_interp(t_fine)
 # Clipping values to be within [0, 1]
 arrivals_profile = np.clip(arrivals_profile, 0, 1)
 
+# The profile covers a day, and it repeats itself every day
+DAY = 24 * 3600
+_profile_times = (t_fine * 3600).tolist()
+_profile_values = arrivals_profile.tolist()
+
+
+def profile_at(time):
+    """
+    Value of the arrivals profile at 'time' (in seconds), linearly
+    interpolated between the points of the table, wrapping every day.
+    """
+    time %= DAY
+    k = min(bisect_right(_profile_times, time), len(_profile_times) - 1)
+    t0, t1 = _profile_times[k - 1], _profile_times[k]
+    v0, v1 = _profile_values[k - 1], _profile_values[k]
+    return v0 + (v1 - v0) * (time - t0) / (t1 - t0)
+
+
+class NonHomogeneousArrivals:
+    """
+    Arrival times of a non-homogeneous Poisson process, whose intensity is
+    'rate' times the arrivals profile (linearly interpolated between the
+    points of the table, and repeated every day).
+
+    The arrivals are generated exactly by time rescaling: the arrival times of
+    a Poisson process with unit rate, E_1 < E_2 < ..., are mapped to
+    L^-1(E_1) < L^-1(E_2) < ..., where L(t) is the integral of the intensity
+    from 0 to t. L is precomputed once: it is piecewise quadratic (the
+    intensity being piecewise linear), so it is inverted in closed form. The
+    arrivals are generated in batches of BATCH_SIZE, with NumPy: the unit
+    rate variates of a batch are drawn at once when the generator is a
+    RandomStream (see RandomStream.exponentials).
+    """
+
+    BATCH_SIZE = 1024
+
+    def __init__(self, rate, rng):
+        self.rng = rng
+        self._times = np.array(_profile_times)
+        self._intensity = rate * arrivals_profile
+        durations = np.diff(self._times)
+        self._slopes = np.diff(self._intensity) / durations
+        # integral of the intensity from 0 to each point of the table
+        self._cumulative = np.concatenate(([0.0], np.cumsum(
+            (self._intensity[:-1] + self._intensity[1:]) / 2 * durations)))
+        self._daily_arrivals = self._cumulative[-1]
+        self._batch = iter(())
+        self._level = 0.0
+        self._last_arrival = None
+
+    def cumulative_intensity(self, time):
+        """
+        Expected number of arrivals from 0 to 'time' (in seconds).
+        """
+        days, time = divmod(np.asarray(time, dtype=float), DAY)
+        k = np.clip(np.searchsorted(self._times, time, side='right') - 1, 0, len(self._times) - 2)
+        elapsed = time - self._times[k]
+        return (days * self._daily_arrivals + self._cumulative[k]
+                + elapsed * (self._intensity[k] + self._slopes[k] * elapsed / 2))
+
+    def inverse_cumulative_intensity(self, level):
+        """
+        Time at which the expected number of arrivals from 0 reaches 'level'.
+        """
+        days, level = divmod(np.asarray(level, dtype=float), self._daily_arrivals)
+        k = np.clip(np.searchsorted(self._cumulative, level, side='right') - 1, 0, len(self._times) - 2)
+        residual = level - self._cumulative[k]
+        intensity = self._intensity[k]
+        # root of intensity * x + slope * x^2 / 2 = residual, in a form that is stable even when slope -> 0
+        discriminant = np.maximum(intensity ** 2 + 2 * self._slopes[k] * residual, 0)
+        return days * DAY + self._times[k] + 2 * residual / (intensity + np.sqrt(discriminant))
+
+    def next_arrival(self, time):
+        """
+        Returns the first arrival after 'time'. If 'time' is not the previous
+        arrival (e.g. at the beginning of the simulation), the process is
+        restarted from 'time', as the increments of a Poisson process are
+        independent.
+        """
+        if time != self._last_arrival:
+            self._level = self.cumulative_intensity(time).item()
+            self._batch = iter(())
+        try:
+            arrival = next(self._batch)
+        except StopIteration:
+            self._batch = self._generate_batch()
+            arrival = next(self._batch)
+        self._last_arrival = arrival
+        return arrival
+
+    def _generate_batch(self):
+        exponentials = getattr(self.rng, 'exponentials', None)
+        if exponentials is not None:
+            variates = exponentials(self.BATCH_SIZE)
+        else:
+            # the 'random' module has no block draws: the variates are drawn one at a time, as in its sequence
+            expovariate = self.rng.expovariate
+            variates = [expovariate(1.0) for _ in range(self.BATCH_SIZE)]
+        levels = self._level + np.cumsum(variates)
+        self._level = levels[-1].item()
+        return iter(self.inverse_cumulative_intensity(levels).tolist())
+
+
 # Plot with improved aesthetics
 if __name__ == "__main__":
     plt.figure(figsize=(10, 5))
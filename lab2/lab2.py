@@ -1,27 +1,195 @@
+import copy
+import gzip
 import json
 import os
+import pickle
 import random
 import shutil
-from enum import Enum
-from queue import PriorityQueue
+import time as timer
+from enum import IntEnum
+
+import numpy as np
 
 import arrivals_profile
-from utils.measurements import Measurement, Measurements
-from utils.queues import BatteryStatus, Battery, Packet
+from utils.events import EventCalendar, FES_BACKENDS
+from utils.measurements import (ColumnarMeasurements, Measurement, Measurements, SamplingPolicy,
+                                StreamingMeasurements)
+from utils.output_analysis import SequentialStopping, mser5_truncation
+from utils.queues import BatteryStatus, Battery, Packet, ReadyDroneIndex
+from utils.random_streams import RandomStream
 
 # LEGEND:
 #   - FES: Finite Event Schedule
 
-variables = {}
-MMms = {}
-data = Measurement()
-measurements = Measurements()
 
+# Roles of the random streams of a simulation with common random numbers (see SimulationContext.stream)
+STREAM_ROLES = ('arrivals', 'dispatch', 'service')
+
+
+class SimulationContext:
+    """
+    State of a single simulation: the configuration variables, the FES, the
+    drones (MMms), the counters (data), the measurements, the random
+    generator (a block-buffered RandomStream, unless given) and the simulated
+    time.
+    The event handlers and the helpers below only operate on the context they
+    are given, so several simulations can live in the same process (e.g. in
+    threads, or in a long-lived worker that reuses its context through reset).
+    """
+
+    def __init__(self, variables=None, rng=None, sampling=SamplingPolicy.PER_EVENT, sampling_step=1,
+                 stream_path=None):
+        self.variables = variables if variables is not None else {}
+        self.rng = rng if rng is not None else RandomStream()
+        self.MMms = {}
+        self.reset(sampling=sampling, sampling_step=sampling_step, stream_path=stream_path)
+
+    def reset(self, seed=None, rng=None, sampling=SamplingPolicy.PER_EVENT, sampling_step=1, stream_path=None,
+              common_random_numbers=False):
+        """
+        Resets the FES, the counters, the measurements and the drones, keeping
+        the variables (the Simulator installs its own FES, of the chosen
+        backend). If 'rng' is given, it replaces the random generator (e.g.
+        with a RandomStream of a replication); otherwise, if 'seed' is given,
+        the random generator is seeded.
+        See Measurements for the available sampling policies of the
+        measurements history. If 'stream_path' is given, the measurements are
+        streamed to that file instead of being kept in memory (see
+        StreamingMeasurements).
+        With 'common_random_numbers', each role of the simulation draws from
+        its own random stream, derived from 'seed' (see stream).
+        """
+        if rng is not None:
+            self.rng = rng
+        elif seed is not None:
+            self.rng.seed(seed)
+        # the same entropy for all the streams, even when the seed is None
+        self._crn_entropy = np.random.SeedSequence(seed).entropy if common_random_numbers else None
+        self._streams = {}
+        # cleared in place, since the task scripts keep a reference to it
+        self.MMms.clear()
+        self.FES = EventCalendar()
+        self.time = 0
+        # arrival process, created at the first arrival (see evt_arrival)
+        self.arrivals = None
+        # index of the drones ready to be sent, built at the first request (see request_drone)
+        self.ready_drones = None
+        self.data = Measurement()
+        # the records of a previous streamed run, still in its last chunk, are written before its file is closed
+        if isinstance(getattr(self, 'measurements', None), StreamingMeasurements):
+            self.measurements.close()
+        if stream_path is not None:
+            self.measurements = StreamingMeasurements(stream_path, sampling=sampling, sampling_step=sampling_step)
+        else:
+            self.measurements = ColumnarMeasurements(sampling=sampling, sampling_step=sampling_step)
+
+    def stream(self, role, *key):
+        """
+        Random generator of the given role (one of STREAM_ROLES), further
+        identified by 'key', e.g. stream('service', drone_id, server_id).
+        Without common random numbers all the roles share self.rng. With them,
+        each role and key has its own RandomStream, which only depends on the
+        seed and on the role: the simulations of different configurations,
+        with the same seed, use the same draws for the same purpose (the same
+        arrivals, the same service times of the i-th antenna of the j-th
+        drone, ...), so their differences are not hidden by the noise.
+        """
+        if self._crn_entropy is None:
+            return self.rng
+        try:
+            return self._streams[(role,) + key]
+        except KeyError:
+            stream = RandomStream(np.random.SeedSequence(self._crn_entropy,
+                                                         spawn_key=(STREAM_ROLES.index(role),) + key))
+            self._streams[(role,) + key] = stream
+            return stream
+
+    def fork(self):
+        """
+        Returns an independent copy of the context, which goes on exactly as
+        this one would: e.g. to simulate only once the history that several
+        variants of a simulation have in common, and then to continue each
+        variant from a copy of it (see run_forked_variants).
+        The measurements must be kept in memory, and the random generator
+        can't be the 'random' module, whose state is shared by the copies.
+        """
+        if self.rng is random:
+            raise ValueError("A context drawing from the 'random' module can't be forked.")
+        if isinstance(self.measurements, StreamingMeasurements):
+            raise ValueError("A context streaming its measurements to a file can't be forked.")
+        return copy.deepcopy(self)
+
+
+def load_variables(task):
+    """
+    Returns the variables of the running case, loaded from the configuration
+    file "variables.json".
+    """
+    with open('variables.json') as f:
+        return json.load(f)[task]
+
+
+class _CheckpointPickler(pickle.Pickler):
+    # the 'random' module (the generator of the default context) is saved by name, and its state apart
+
+    def persistent_id(self, obj):
+        return 'random' if obj is random else None
+
+
+class _CheckpointUnpickler(pickle.Unpickler):
+
+    def persistent_load(self, pid):
+        if pid == 'random':
+            return random
+        raise pickle.UnpicklingError(f"Unknown persistent id '{pid}'")
+
+
+def save_checkpoint(ctx: SimulationContext, path):
+    """
+    Saves the whole state of a simulation in a gzip-compressed pickle: the
+    FES, the drones (queues, servers and batteries), the counters, the
+    measurements (a StreamingMeasurements only keeps the number of records
+    already in its file) and the state of the random generators.
+    The checkpoint is written to a temporary file and then renamed, so a crash
+    while saving never leaves a broken checkpoint behind.
+    """
+    temporary_path = path + '.tmp'
+    with gzip.open(temporary_path, 'wb') as f:
+        _CheckpointPickler(f, pickle.HIGHEST_PROTOCOL).dump((ctx, random.getstate()))
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Returns the SimulationContext saved by save_checkpoint. The simulation
+    can be continued with Simulator(ctx=..., resume=True), and it goes on
+    exactly as the one that was saved would have.
+    If the context draws from the 'random' module, its state is restored too.
+    """
+    with gzip.open(path, 'rb') as f:
+        ctx, random_state = _CheckpointUnpickler(f).load()
+    if ctx.rng is random:
+        random.setstate(random_state)
+    return ctx
+
+
+# Default context, used by the scripts through the module level names below. It
+# draws from the 'random' module, so that random.seed() keeps working on it.
+context = SimulationContext(rng=random)
+variables = context.variables
+MMms = context.MMms
+data = context.data
+measurements = context.measurements
 
-def init_simulation_environment():
+
+def init_simulation_environment(sampling=SamplingPolicy.PER_EVENT, sampling_step=1, stream_path=None):
+    """
+    Resets the default context (see SimulationContext.reset).
+    """
     global data, measurements
-    data = Measurement()
-    measurements = Measurements()
+    context.reset(sampling=sampling, sampling_step=sampling_step, stream_path=stream_path)
+    data = context.data
+    measurements = context.measurements
 
 
 def init_variables(task):
@@ -31,11 +199,12 @@ def init_variables(task):
     so it is useful to make them change depending on the threatened task
     """
     global variables
-    with open('variables.json') as f:
-        variables = json.load(f)[task]
+    variables = context.variables = load_variables(task)
+    return variables
 
 
-class Event(Enum):
+class Event(IntEnum):
+    # IntEnum so that the event type can directly index the Simulator dispatch table
     ARRIVAL = 1
     DEPARTURE = 2
     SWITCH_OFF = 3
@@ -55,7 +224,7 @@ def is_drone_ready(time, drone: MMms):
             and not drone.has_exceeded_max_complete_cycles())
 
 
-def assign_packet_to_drone(time):
+def assign_packet_to_drone(ctx: SimulationContext, time):
     # """
     # When a packet arrives, we want it to be assigned to a running drone.
     # It returns the id of the fastest (highest capacity) drone, if any
@@ -70,20 +239,20 @@ def assign_packet_to_drone(time):
     #     drones = sorted(drones, key=lambda drone: drone[1].get_capacity(), reverse=True)
     #     return drones[0][0]
     # return None
-    requested_drone_id = random.choice(list(MMms.keys()))
-    drone = MMms[requested_drone_id]
+    requested_drone_id = ctx.stream('dispatch').choice(list(ctx.MMms.keys()))
+    drone = ctx.MMms[requested_drone_id]
     if is_drone_available(time, drone):
         return requested_drone_id
     else:
         return None
 
 
-def send_drone(time, FES: PriorityQueue, drone_id, desired_time=0):
+def send_drone(ctx: SimulationContext, time, drone_id, desired_time=0):
     """
     Activates a drone, and schedules its battery consumption.
     If 'tot_time' is set to 0, the maximum will be set
     """
-    drone = MMms[drone_id]
+    drone = ctx.MMms[drone_id]
     # checking if battery is full, and managing the case of an eventual solar panel equipped
     if drone.battery.status == BatteryStatus.FULL:
         drone.switch_on(solar_panel=8 * 3600 <= time <= 16 * 3600)
@@ -92,102 +261,120 @@ def send_drone(time, FES: PriorityQueue, drone_id, desired_time=0):
     else:
         tot_time = min(desired_time, drone.battery.residual)
     if not drone.battery.is_infinite():
-        FES.put((time + tot_time, Event.SWITCH_OFF, drone_id, tot_time))
-    data.drones += 1
-    measurements.add_measurement(measurement=data)
+        ctx.FES.put((time + tot_time, Event.SWITCH_OFF, drone_id, tot_time))
+    ctx.data.drones += 1
+    ctx.measurements.add_measurement(measurement=ctx.data)
 
 
-def request_drone(time):
+def request_drone(ctx: SimulationContext, time):
     """
     Used after a loss, to "call" another drone to manage the load.
     It returns the id of the fastest (average service time of its servers)
     drone, if any available (battery not empty).
+    The drones ready to be sent (see is_drone_ready) are kept, ordered by
+    capacity, in a ReadyDroneIndex, updated when they change state, instead of
+    filtering and sorting the whole fleet at each request.
     """
-    drones = list(filter(lambda drone: is_drone_ready(time, drone[1]), MMms.items()))
-    if len(drones) > 0:
-        drones = sorted(drones, key=lambda drone: drone[1].get_capacity(), reverse=True)
-        i_max = len(drones) - 1
-        req = int(i_max * arrivals_profile.arrivals_profile[int(time / 3600)])
-        return drones[req][0]
+    ready_drones = ctx.ready_drones
+    if ready_drones is None:
+        ready_drones = ctx.ready_drones = ReadyDroneIndex(ctx.MMms)
+    ready_drones.advance(time)
+    if len(ready_drones) > 0:
+        return ready_drones.select(arrivals_profile.profile_at(time))
     return None
 
 
-def schedule_recharge(time, FES: PriorityQueue, drone_id):
+def schedule_recharge(ctx: SimulationContext, time, drone_id):
     """
     Used to schedule the fully charged battery of a drone, after it has
     been emptied.
     """
-    FES.put((time + Battery.RECHARGE_TIME, Event.RECHARGE, drone_id, None))
-    data.charging_drones += 1
-    measurements.add_measurement(measurement=data)
-    req_drone = request_drone(time)
+    ctx.FES.put((time + Battery.RECHARGE_TIME, Event.RECHARGE, drone_id, None))
+    ctx.data.charging_drones += 1
+    ctx.measurements.add_measurement(measurement=ctx.data)
+    req_drone = request_drone(ctx, time)
     if req_drone is not None:
-        send_drone(time, FES, req_drone)
+        send_drone(ctx, time, req_drone)
+
 
+# The event handlers share the signature handler(ctx, time, drone_id, arg), so
+# that the Simulator can dispatch them directly.
 
-def evt_switch_off(time, FES: PriorityQueue, drone_id, tot_time):
+def evt_switch_off(ctx: SimulationContext, time, drone_id, tot_time):
     """
     Called when a drone has to be switched off. All its queue is lost, even
-    if there's still energy in its battery.
+    if there's still energy in its battery, and leaves the system.
+    The packets being served are lost too: their DEPARTURE events, still in
+    the FES, become stale and are skipped (see evt_departure).
     """
-    drone = MMms[drone_id]
+    data = ctx.data
+    drone = ctx.MMms[drone_id]
     drone.battery_consume(usage_time=tot_time)
+    data.users_moments.add(data.users, time - data.time)
+    data.average_users += data.users * (time - data.time)
+    data.time = time
+    data.losses += drone._get_servers_working()
+    # the queue holds both the packets waiting and the ones being served
+    data.users -= drone.queue_size()
     if drone.battery.residual == 0:
-        data.users -= drone.queue_size()
         drone.switch_off(empty_battery=True)
-        schedule_recharge(time, FES, drone_id)
+        schedule_recharge(ctx, time, drone_id)
     else:
         drone.switch_off(empty_battery=False)
     data.drones -= 1
-    measurements.add_measurement(measurement=data)
+    ctx.measurements.add_measurement(measurement=data)
 
 
-def evt_recharge(time, drone_id):
+def evt_recharge(ctx: SimulationContext, time, drone_id, arg=None):
     """
     Called when the battery of a drone has been fully charged.
     """
-    drone = MMms[drone_id]
+    data = ctx.data
+    drone = ctx.MMms[drone_id]
     drone.battery_recharge()
     data.charging_drones -= 1
     data.charging_cycles += 1
-    measurements.add_measurement(measurement=data)
+    ctx.measurements.add_measurement(measurement=data)
 
 
-def evt_arrival(time, FES: PriorityQueue):
+def evt_arrival(ctx: SimulationContext, time, drone_id=None, arg=None):
     """
     Called when there's an arrival packet.
     """
+    data = ctx.data
+    FES = ctx.FES
+    data.users_moments.add(data.users, time - data.time)
     # loss management - boolean result
-    drone_id = assign_packet_to_drone(time)
+    drone_id = assign_packet_to_drone(ctx, time)
     loss = drone_id is None
     if loss:
-        req_drone_id = request_drone(time)
+        req_drone_id = request_drone(ctx, time)
         if req_drone_id is not None:
-            send_drone(time, FES, req_drone_id)
+            send_drone(ctx, time, req_drone_id)
         data.losses += 1
     else:
         data.users += 1
         # create a record for the client
         client = Packet(arrival_time=time)
         # insert the record in the queue
-        drone = MMms[drone_id]
+        drone = ctx.MMms[drone_id]
         drone.insert(packet=client)
 
         # if the server is idle start the service
         if drone.can_engage_server():
             (s_id, s_service_time) = drone.engage_server()
             # sample the service time
-            service_time = random.expovariate(1.0 / s_service_time)
+            service_time = ctx.stream('service', drone_id, s_id).expovariate(1.0 / s_service_time)
 
             # schedule when the client will finish the service
-            FES.put((time + service_time, Event.DEPARTURE, drone_id, s_id))
+            FES.put((time + service_time, Event.DEPARTURE, drone_id, (s_id, drone.generation)))
 
-    # sample the time until the next event
-    current_arrival_percentage = arrivals_profile.arrivals_profile[int(time / 3600)]
-    inter_arrival = random.expovariate(lambd=variables['ARRIVAL_RATE'] * current_arrival_percentage)
-
-    # schedule the next arrival
-    FES.put((time + inter_arrival, Event.ARRIVAL, None, None))
+    # schedule the next arrival, following the arrivals profile of the day
+    arrivals = ctx.arrivals
+    if arrivals is None:
+        arrivals = ctx.arrivals = arrivals_profile.NonHomogeneousArrivals(
+            ctx.variables['ARRIVAL_RATE'], ctx.stream('arrivals'))
+    FES.put((arrivals.next_arrival(time), Event.ARRIVAL, None, None))
 
     # cumulate statistics
     data.arrivals += 1
@@ -195,39 +382,47 @@ def evt_arrival(time, FES: PriorityQueue):
     data.average_users += data.users * (time - data.time)  # average users per time unit
     data.time = time
     # measurements
-    measurements.add_measurement(measurement=data)
+    ctx.measurements.add_measurement(measurement=data)
 
 
-def evt_departure(time, FES, drone_id, server_id):
+def evt_departure(ctx: SimulationContext, time, drone_id, arg):
     """
     Called when a packet has been processed by a server of a drone.
+    'arg' is the pair (server_id, generation), where generation is the one of
+    the drone when the service started: if the drone has been switched off in
+    the meantime, the event is stale and it is skipped.
     """
+    data = ctx.data
     # drone scheduled
-    drone = MMms[drone_id]
+    drone = ctx.MMms[drone_id]
+    server_id, generation = arg
 
-    # losses management
-    loss = drone.battery.status != BatteryStatus.IN_USE
-    if loss:
-        data.losses += 1
-        data.average_losses = data.losses / data.arrivals
-    else:
-        data.users -= 1
-        data.departures += 1
-        # get the first element from the queue
-        client = drone.consume(server_id)
+    if generation != drone.generation:
+        data.stale_events += 1
+        return
 
-        # do whatever we need to do when clients go away
+    data.users_moments.add(data.users, time - data.time)
+    data.users -= 1
+    data.departures += 1
+    # get the first element from the queue
+    client = drone.consume(server_id)
 
-        data.delay += (time - client.arrival_time)
+    # do whatever we need to do when clients go away
 
-        # see whether there are more clients to in the line
-        if drone.can_engage_server():
-            (s_id, s_service_time) = drone.engage_server()
-            # sample the service time
-            service_time = random.expovariate(1.0 / s_service_time)
+    delay = time - client.arrival_time
+    data.delay += delay
+    data.delay_moments.add(delay)
+    for quantile in data.delay_quantiles.values():
+        quantile.add(delay)
 
-            # schedule when the client will finish the service
-            FES.put((time + service_time, Event.DEPARTURE, drone_id, s_id))
+    # see whether there are more clients to in the line
+    if drone.can_engage_server():
+        (s_id, s_service_time) = drone.engage_server()
+        # sample the service time
+        service_time = ctx.stream('service', drone_id, s_id).expovariate(1.0 / s_service_time)
+
+        # schedule when the client will finish the service
+        ctx.FES.put((time + service_time, Event.DEPARTURE, drone_id, (s_id, drone.generation)))
 
     # cumulate statistics
     data.total_users += data.users
@@ -235,7 +430,267 @@ def evt_departure(time, FES, drone_id, server_id):
     data.time = time
     data.average_delay = data.delay / data.departures
     # measurements
-    measurements.add_measurement(measurement=data)
+    ctx.measurements.add_measurement(measurement=data)
+
+
+class KernelInstrumentation:
+    """
+    Opt-in instrumentation of the event loop of the Simulator: the number of
+    events and the cumulative time of their handlers (perf_counter_ns) for
+    each event type, the peak size of the FES and the number of measurement
+    records added, summed over all the runs of the process.
+    While it is disabled (the default), the simulators run their plain loops,
+    so it costs nothing. It is enabled by setting the environment variable
+    LAB2_INSTRUMENTATION=1 before running a task script, or by enable().
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def reset(self):
+        self.counts = [0] * (max(Event) + 1)
+        self.times_ns = [0] * (max(Event) + 1)
+        self.peak_fes_size = 0
+        self.measurement_records = 0
+
+    def summary(self):
+        """
+        Returns a table with the counters, one row per event type.
+        """
+        total_ns = sum(self.times_ns)
+        lines = ['{:<12s}{:>12s}{:>14s}{:>14s}{:>10s}'.format('Event', 'Count', 'Total [ms]', 'Mean [us]', 'Share')]
+        for event_type in Event:
+            count = self.counts[event_type]
+            time_ns = self.times_ns[event_type]
+            lines.append('{:<12s}{:>12d}{:>14.1f}{:>14.2f}{:>9.1f}%'.format(
+                event_type.name, count, time_ns / 1e6, time_ns / count / 1e3 if count else 0.0,
+                time_ns / total_ns * 100 if total_ns else 0.0))
+        lines.append('{:<12s}{:>12d}{:>14.1f}'.format('Total', sum(self.counts), total_ns / 1e6))
+        lines.append('Peak FES size: {:d} - Measurement records: {:d}'.format(self.peak_fes_size,
+                                                                             self.measurement_records))
+        return '\n'.join(lines)
+
+
+# Instrumentation shared by all the simulators of the process
+instrumentation = KernelInstrumentation(enabled=os.environ.get('LAB2_INSTRUMENTATION', '0') not in ('', '0'))
+
+
+def print_instrumentation_summary():
+    """
+    Prints the summary of the kernel instrumentation, if it is enabled.
+    Called at the end of the task scripts.
+    """
+    if instrumentation.enabled:
+        print('\nKernel instrumentation')
+        print(instrumentation.summary())
+
+
+class Simulator:
+    """
+    Event loop shared by all the tasks. Events are popped from the FES and
+    dispatched through a table indexed by event type, instead of a chain of
+    comparisons evaluated for every event.
+    Handlers are called as handler(ctx, time, drone_id, arg), where ctx is the
+    SimulationContext being simulated (the module default one, if not given).
+    Hooks are callables with signature hook(time, event_type, drone_id, arg),
+    called after each event has been handled.
+    The FES is either given, or created from one of the FES_BACKENDS ('heap',
+    the default, or 'calendar', better suited to large drone fleets). With
+    'resume', the FES and the time of the context are kept instead, e.g. to
+    continue a simulation restored by load_checkpoint.
+    Otherwise the time of the last update of the counters (data.time) is set
+    to the start time, so that the time-weighted users statistics are
+    accumulated from there, and not from 0, and the index of the ready drones
+    is dropped, to be rebuilt on the drones of this run (the tasks replace
+    the drones of the context between runs).
+    """
+
+    def __init__(self, FES=None, start_time=0, backend='heap', ctx: SimulationContext = None, resume=False):
+        self.ctx = ctx if ctx is not None else context
+        if not resume:
+            self.ctx.FES = FES if FES is not None else FES_BACKENDS[backend]()
+            self.ctx.time = start_time
+            self.ctx.data.time = start_time
+            self.ctx.ready_drones = None
+        self.processed_events = 0
+        self.hooks = []
+        self._handlers = [None] * (max(Event) + 1)
+        self.register_handler(Event.ARRIVAL, evt_arrival)
+        self.register_handler(Event.DEPARTURE, evt_departure)
+        self.register_handler(Event.SWITCH_OFF, evt_switch_off)
+        self.register_handler(Event.RECHARGE, evt_recharge)
+
+    @property
+    def FES(self):
+        return self.ctx.FES
+
+    @property
+    def time(self):
+        return self.ctx.time
+
+    def register_handler(self, event_type: Event, handler):
+        """
+        Sets the handler of an event type. It is called as handler(ctx, time, drone_id, arg).
+        """
+        self._handlers[event_type] = handler
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def schedule(self, time, event_type: Event, drone_id=None, arg=None):
+        self.ctx.FES.put((time, event_type, drone_id, arg))
+
+    def run(self, until, stopping: SequentialStopping = None, stop_when=None):
+        """
+        Processes events until the simulated time reaches 'until'. As in the
+        original loops, the event that crosses 'until' is processed as well.
+        If a 'stopping' rule is given, it is checked every stopping.check_every
+        events, and the simulation stops as soon as it is satisfied (then
+        'until' is only an upper bound): see stopping.report for the achieved
+        precision.
+        If 'stop_when' is given, stop_when(ctx) is checked after each event,
+        and the simulation stops right after the first one making it true, so
+        that it can be continued later by another call.
+        The measurements are flushed before returning (see
+        StreamingMeasurements).
+        Returns the time of the last processed event.
+        """
+        if instrumentation.enabled:
+            return self._run_instrumented(until, stopping, stop_when)
+        ctx = self.ctx
+        get = ctx.FES.get
+        handlers = self._handlers
+        hooks = self.hooks
+        time = ctx.time
+        events = 0
+        if stopping is not None or stop_when is not None:
+            next_check = stopping.check_every if stopping is not None else None
+            while time < until:
+                (time, event_type, drone_id, arg) = get()
+                handlers[event_type](ctx, time, drone_id, arg)
+                for hook in hooks:
+                    hook(time, event_type, drone_id, arg)
+                events += 1
+                if stop_when is not None and stop_when(ctx):
+                    break
+                if events == next_check:
+                    next_check += stopping.check_every
+                    if stopping.update(ctx.data):
+                        break
+        elif hooks:
+            while time < until:
+                (time, event_type, drone_id, arg) = get()
+                handlers[event_type](ctx, time, drone_id, arg)
+                for hook in hooks:
+                    hook(time, event_type, drone_id, arg)
+                events += 1
+        else:
+            while time < until:
+                (time, event_type, drone_id, arg) = get()
+                handlers[event_type](ctx, time, drone_id, arg)
+                events += 1
+        ctx.time = time
+        self.processed_events += events
+        # the file of streamed measurements is complete after each run
+        ctx.measurements.flush()
+        return time
+
+    def _run_instrumented(self, until, stopping, stop_when):
+        """
+        Same as run, but each handler is timed, and the FES size is checked
+        after each event (see KernelInstrumentation).
+        """
+        ctx = self.ctx
+        FES = ctx.FES
+        get = FES.get
+        # qsize, unlike len, is also supported by a queue.PriorityQueue given as FES
+        fes_size = FES.qsize
+        handlers = self._handlers
+        hooks = self.hooks
+        counts = instrumentation.counts
+        times_ns = instrumentation.times_ns
+        perf_counter_ns = timer.perf_counter_ns
+        peak_fes_size = instrumentation.peak_fes_size
+        records = ctx.measurements.record_count()
+        next_check = stopping.check_every if stopping is not None else None
+        time = ctx.time
+        events = 0
+        while time < until:
+            (time, event_type, drone_id, arg) = get()
+            start = perf_counter_ns()
+            handlers[event_type](ctx, time, drone_id, arg)
+            times_ns[event_type] += perf_counter_ns() - start
+            counts[event_type] += 1
+            if fes_size() > peak_fes_size:
+                peak_fes_size = fes_size()
+            for hook in hooks:
+                hook(time, event_type, drone_id, arg)
+            events += 1
+            if stop_when is not None and stop_when(ctx):
+                break
+            if events == next_check:
+                next_check += stopping.check_every
+                if stopping.update(ctx.data):
+                    break
+        instrumentation.peak_fes_size = peak_fes_size
+        instrumentation.measurement_records += ctx.measurements.record_count() - records
+        ctx.time = time
+        self.processed_events += events
+        ctx.measurements.flush()
+        return time
+
+    def fork(self):
+        """
+        Returns a simulator, with the same handlers and hooks, over an
+        independent copy of the context (see SimulationContext.fork).
+        """
+        simulator = Simulator(ctx=self.ctx.fork(), resume=True)
+        simulator._handlers = list(self._handlers)
+        simulator.hooks = list(self.hooks)
+        simulator.processed_events = self.processed_events
+        return simulator
+
+    def run_with_checkpoints(self, until, checkpoint_path, interval):
+        """
+        Same as run, but the context is saved to 'checkpoint_path' (see
+        save_checkpoint) every 'interval' simulated time units and at the end.
+        Since run also processes the event crossing its 'until', the steps
+        process exactly the same events of a single run.
+        Returns the time of the last processed event.
+        """
+        time = self.ctx.time
+        while time < until:
+            time = self.run(until=min(time + interval, until))
+            save_checkpoint(self.ctx, checkpoint_path)
+        return time
+
+
+def run_forked_variants(simulator: Simulator, until, variants):
+    """
+    Simulates until 'until' several variants of the same simulation, which
+    have the same history up to the point where each one of them diverges
+    from the others, simulating that common history only once.
+    'variants' is a list of (diverges, configure) pairs, in the order in which
+    they diverge: the shared simulation is run until diverges(ctx) becomes
+    true (see Simulator.run), then the context is forked, the variant is
+    applied to the copy with configure(ctx), and the copy is run to the end.
+    diverges can be None for a variant which never diverges, i.e. the last
+    one, which is applied directly to the shared simulation.
+    Returns the list of the simulators of the variants, in the given order.
+    """
+    simulators = []
+    for i, (diverges, configure) in enumerate(variants):
+        if diverges is not None and not diverges(simulator.ctx):
+            simulator.run(until=until, stop_when=diverges)
+        variant = simulator if i == len(variants) - 1 else simulator.fork()
+        configure(variant.ctx)
+        variant.run(until=until)
+        simulators.append(variant)
+    return simulators
 
 
 def clear_folder(folder_path):
@@ -251,81 +706,91 @@ def clear_folder(folder_path):
             print(f'Failed to delete {file_path}. Reason: {e}')
 
 
-def calculate_warmup_period(buffer_size, measurements: Measurements, gap_threshold=100):
+# Methods to detect the end of the warmup of a working slot (see detect_steady_state_slots)
+WARMUP_METHODS = ('buffer', 'mser5')
+
+
+def detect_steady_state_slots(buffer_size, measurements: Measurements, gap_threshold=100, method='buffer'):
     """
-    Calculates the warmup period for each working slot, where users != 0,
-    and saves a JSON file containing the working slots in steady state.
+    Detects the working slots, where users != 0, and the warmup period of each
+    one of them. It works directly on the 'time' and 'users' columns of the
+    measurements, so each slot is found with a binary search instead of a scan
+    of the whole history.
+    The warmup of a slot ends either when the users first reach the buffer size
+    (method='buffer'), or at the truncation point of the MSER-5 rule on the
+    users of the slot (method='mser5'), which usually discards much less data.
 
     :param buffer_size: The buffer size to determine when the system reaches steady-state.
     :param measurements: The measurements object containing user counts over time.
     :param gap_threshold: The maximum allowed gap (in time units) to merge consecutive working slots.
-    :return: List of transition points from transient to steady-state for each slot.
+    :param method: How the end of the warmup is detected, one of WARMUP_METHODS.
+    :return: The list of transition points from transient to steady-state for each slot, and the list
+             of the steady state working slots, as [warmup time, end time] pairs.
     """
-    # Extract the times and the number of users from the measurement history
-    lot = list(map(lambda m: (m.time, m.users), measurements.history))
-    times, users = list(zip(*lot))
+    if method not in WARMUP_METHODS:
+        raise ValueError(f"Warmup detection method '{method}' is not supported.")
+    times = np.asarray(measurements.column('time'), dtype=float)
+    users = np.asarray(measurements.column('users'))
+
+    nonzero = np.flatnonzero(users != 0)
+    if not len(nonzero):
+        return [], []
+
+    # A slot ends when users have been zero for longer than the gap threshold, i.e. when, between two
+    # consecutive non-zero measurements, the last zero one is more than gap_threshold after the first
+    previous = nonzero[:-1]
+    following = nonzero[1:]
+    split = (following - 1 > previous) & (times[following - 1] - times[previous] > gap_threshold)
+    start_times = times[np.concatenate(([nonzero[0]], following[split]))]
+    end_times = times[np.concatenate((previous[split], [nonzero[-1]]))]
+
+    # Measurements falling within each slot (bounds included)
+    first = np.searchsorted(times, start_times, side='left')
+    last = np.searchsorted(times, end_times, side='right')
 
-    # List to store the transition points from transient to steady-state for each time slot
     warmup_times = []
-
-    # Detect working slots where users != 0
-    time_slots = []
-    steady_state_slots = []  # To store the steady state working slots
-    in_slot = False
-    start_time = None
-    last_nonzero_time = None
-
-    for time, user_count in zip(times, users):
-        if user_count != 0:
-            if not in_slot:
-                # Start a new slot if we weren't already in one
-                start_time = time
-                in_slot = True
-            last_nonzero_time = time
-        elif in_slot and (time - last_nonzero_time > gap_threshold):
-            # End the current slot if users have been zero for longer than the gap threshold
-            end_time = last_nonzero_time
-            time_slots.append([start_time, end_time])
-            in_slot = False
-
-    # If the last time slot is still open, close it at the last non-zero user time
-    if in_slot:
-        time_slots.append([start_time, last_nonzero_time])
-
-    # For each time slot, find when the number of users reaches the buffer size
-    for slot in time_slots:
-        start_time, end_time = slot
-        transient_period = None
-        max_users = 0
-        max_users_time = start_time  # Keep track of the time when max users occur in the slot
-
-        # Loop through the measurements within the time slot
-        for time, user_count in zip(times, users):
-            if start_time <= time <= end_time:
-                # Track the time when the maximum users occurred
-                if user_count > max_users:
-                    max_users = user_count
-                    max_users_time = time
-
-                # If users reach the buffer size, mark this time as the transient period end
-                if user_count >= buffer_size:
-                    transient_period = time
-                    break  # Once buffer size is reached, we exit the loop
-
-        # If we found a transient period, we assume the rest of the time is steady-state
-        if transient_period:
-            warmup_times.append(transient_period)
-            # Add the steady state working slot (from warmup time to end of time slot)
-            steady_state_slots.append([transient_period, end_time])
-        else:
+    steady_state_slots = []
+    for start_time, end_time, i, j in zip(start_times.tolist(), end_times.tolist(), first, last):
+        slot_users = users[i:j]
+        full = slot_users >= buffer_size
+        if method == 'mser5':
+            # MSER-5 truncation point of the users of the slot
+            transient_period = times[i + mser5_truncation(slot_users)].item()
+        elif full.any():
+            # Users reach the buffer size: we assume the rest of the slot is steady-state
+            transient_period = times[i + np.argmax(full)].item()
+        elif slot_users.max() > 0:
             # If buffer size is not reached, use the time when the maximum users occurred
-            warmup_times.append(max_users_time)
-            steady_state_slots.append([max_users_time, end_time])
+            transient_period = times[i + np.argmax(slot_users)].item()
+        else:
+            transient_period = start_time
+        warmup_times.append(transient_period)
+        steady_state_slots.append([transient_period, end_time])
+
+    return warmup_times, steady_state_slots
+
+
+def calculate_warmup_period(buffer_size, measurements: Measurements, gap_threshold=100,
+                            steady_state_json_path="./report_images/steady_state_working_slots.json",
+                            method='buffer'):
+    """
+    Calculates the warmup period for each working slot, where users != 0,
+    and saves a JSON file containing the working slots in steady state
+    (unless steady_state_json_path is None).
+
+    :param buffer_size: The buffer size to determine when the system reaches steady-state.
+    :param measurements: The measurements object containing user counts over time.
+    :param gap_threshold: The maximum allowed gap (in time units) to merge consecutive working slots.
+    :param steady_state_json_path: Where to save the steady state working slots.
+    :param method: How the end of the warmup is detected, one of WARMUP_METHODS.
+    :return: List of transition points from transient to steady-state for each slot.
+    """
+    warmup_times, steady_state_slots = detect_steady_state_slots(buffer_size, measurements, gap_threshold, method)
 
     # Save the steady-state slots to a JSON file
-    steady_state_json_path = "./report_images/steady_state_working_slots.json"
-    with open(steady_state_json_path, 'w') as json_file:
-        json.dump(steady_state_slots, json_file, indent=4)
+    if steady_state_json_path is not None:
+        with open(steady_state_json_path, 'w') as json_file:
+            json.dump(steady_state_slots, json_file, indent=4)
 
     # Return the list of all warmup times (transition points from transient to steady-state)
     return warmup_times
@@ -19,7 +19,13 @@ def print_results(data: Measurement):
     print('Departures percentage: {:.3f}%'.format(data.departures / data.arrivals * 100))
     print('Average number of users: {:.3f}'.format(data.average_users / SIM_TIME))
     print('Average delay: {:.3f} s/packet'.format(data.delay / data.departures))
+    print('Delay standard deviation: {:.3f} s'.format(data.delay_moments.std))
+    print('Delay percentiles: p50 {:.3f} s - p95 {:.3f} s - p99 {:.3f} s'.format(
+        *(quantile.value for quantile in data.delay_quantiles.values())))
+    print('Time-weighted users: mean {:.3f} - standard deviation {:.3f}'.format(data.users_moments.mean,
+                                                                            data.users_moments.std))
     print('Complete discharging/charging cycles: ', data.charging_cycles)
+    print('Stale events skipped (drones switched off): ', data.stale_events)
 
 
 def plot_users(measurements: Measurements):
@@ -61,22 +67,23 @@ def plot_users_with_warmup(measurements: Measurements, warmup_times):
     plt.close()
 
 
-def plot_users_with_steady_state(measurements: Measurements):
+def plot_users_with_steady_state(measurements: Measurements, steady_state_slots=None):
     json_filepath = "./report_images/steady_state_working_slots.json"
 
     plt.figure()
 
     # Extract time and users from the measurements
-    lot = list(map(lambda m: (m.time, m.users), measurements.history))
-    times, users = list(zip(*lot))
+    times = measurements.column('time')
+    users = measurements.column('users')
 
     # Plot the users over time
     plt.subplots(figsize=(14, 8))
     plt.plot(times, users)
 
-    # Load the steady-state working slots from the JSON file
-    with open(json_filepath, 'r') as json_file:
-        steady_state_slots = json.load(json_file)
+    # Load the steady-state working slots from the JSON file, if they are not given
+    if steady_state_slots is None:
+        with open(json_filepath, 'r') as json_file:
+            steady_state_slots = json.load(json_file)
 
     # Add vertical blue lines for each steady-state slot
     for slot in steady_state_slots:
@@ -0,0 +1,65 @@
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import lab2
+from utils.random_streams import spawn_streams
+
+# Number of worker processes used by default by run_sweep (one per core)
+MAX_WORKERS = os.cpu_count() or 1
+
+
+def expand_grid(**axes):
+    """
+    Expands the given axes (e.g. scheduling_key=[...], recharging_key=[...])
+    into the list of all their combinations, as keyword arguments of a job.
+    The order is the one of the nested for loops over the axes, in the given
+    order, so that the results of a sweep are always collected in the same
+    order of the serial version.
+    """
+    names = list(axes.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*axes.values())]
+
+
+def _init_worker(task):
+    lab2.init_variables(task)
+
+
+def run_sweep(job, grid, task, max_workers=MAX_WORKERS):
+    """
+    Runs job(**params) for each params of the grid, on a pool of 'max_workers'
+    processes, and returns the list of the results in the order of the grid.
+
+    Every job must be independent from the others: each worker process has its
+    own copy of the lab2 globals, initialized for 'task', and each job has to
+    reset the simulation environment and seed the random generator by itself.
+    The job must be a module level function, so that it can be sent to the
+    workers. With max_workers=1 the jobs are run serially in this process,
+    whose variables must be already initialized, and so they are when the
+    kernel instrumentation is enabled, to count the events of all the jobs.
+    """
+    if max_workers == 1 or len(grid) <= 1 or lab2.instrumentation.enabled:
+        return [job(**params) for params in grid]
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(grid)),
+                             initializer=_init_worker, initargs=(task,)) as executor:
+        futures = [executor.submit(job, **params) for params in grid]
+        return [future.result() for future in futures]
+
+
+def run_replications(job, grid, task, replications, seed=None, max_workers=MAX_WORKERS):
+    """
+    Runs 'replications' independent replications of each job of the grid, all
+    of them on the same pool (see run_sweep), as job(rng=..., **params).
+    The i-th replication of every job draws from the i-th RandomStream spawned
+    from SeedSequence(seed): the replications are statistically independent,
+    while different jobs are compared with common random numbers.
+    Returns, for each params of the grid, the list of the results of its
+    replications.
+    """
+    # the same entropy for all the jobs, even when the seed is None
+    entropy = np.random.SeedSequence(seed).entropy
+    jobs = [dict(params, rng=stream) for params in grid for stream in spawn_streams(entropy, replications)]
+    results = run_sweep(job, jobs, task, max_workers=max_workers)
+    return [results[i:i + replications] for i in range(0, len(results), replications)]
@@ -1,12 +1,16 @@
 import random
-from queue import PriorityQueue
 import lab2
 import results_visualization
-from lab2 import (Event, evt_arrival, evt_departure, evt_recharge, evt_switch_off, calculate_warmup_period,
-                  clear_folder, seconds_to_time_string, start_working_intervals, save_steady_state_metrics, FilteredMeasurements)
+from lab2 import (Event, Simulator, detect_steady_state_slots,
+                  clear_folder, seconds_to_time_string, start_working_intervals, save_steady_state_metrics)
+from utils.measurements import FilteredMeasurements
 from utils.queues import MMmB
 import json
 
+# How the end of the warm-up of each working slot is detected: 'buffer' (the users reach the buffer size)
+# or 'mser5' (MSER-5 truncation of the users series, which discards less data)
+WARMUP_METHOD = 'buffer'
+
 # Clear the folder where report images will be stored to ensure fresh output.
 clear_folder('./report_images')
 
@@ -40,44 +44,26 @@ def simulation_pipeline(slot_counter, start_working_time):
 
     random.seed(42)  # Set a seed for reproducibility of random events in the simulation
 
-    # Initialize simulation time
-    time = 0
-
-    # Priority queue for Future Event Scheduling (FES) to handle events like ARRIVAL, DEPARTURE, etc.
-    FES = PriorityQueue()
+    # Event loop over the Future Event Schedule (FES), handling events like ARRIVAL, DEPARTURE, etc.
+    simulator = Simulator(start_time=0)
 
     # Schedule the first event, an arrival at time 0, to start the simulation
-    FES.put((0, Event.ARRIVAL, None, None))
+    simulator.schedule(0, Event.ARRIVAL)
 
     # Simulation loop continues until the total simulation time is reached
-    while time < variables['SIM_TIME']:
-        # Fetch the next event from the queue (sorted by event time)
-        (time, event_type, drone_id, arg) = FES.get()
-
-        # Handle different types of events
-        if event_type == Event.ARRIVAL:
-            evt_arrival(time, FES)  # Handle packet arrival event
-        elif event_type == Event.DEPARTURE:
-            evt_departure(time, FES, drone_id, arg)  # Handle packet departure event
-        elif event_type == Event.SWITCH_OFF:
-            evt_switch_off(time, FES, drone_id, arg)  # Handle drone switch off event
-        elif event_type == Event.RECHARGE:
-            evt_recharge(time, drone_id)  # Handle drone recharge event
+    simulator.run(until=variables['SIM_TIME'])
 
     # Set the start time for visualizations based on the configured start time
     results_visualization.SIM_START = variables['SIM_START']
 
     # Calculate the warm-up period to remove transient behavior and focus on steady-state behavior
-    warmup_period = calculate_warmup_period(
+    # (together with the steady-state time intervals)
+    warmup_period, steady_state_lists = detect_steady_state_slots(
         buffer_size=variables['BASE_BUFFER_SIZE'] * drone['BUFFER_SIZE'],  # Calculate using buffer size
-        measurements=measurements  # Use the recorded measurements to estimate when steady state is reached
+        measurements=measurements,  # Use the recorded measurements to estimate when steady state is reached
+        method=WARMUP_METHOD
     )
 
-    # Load the steady-state time intervals from the generated JSON file
-    steady_state_json_filepath = "./report_images/steady_state_working_slots.json"
-    with open(steady_state_json_filepath) as json_file:
-        steady_state_lists = json.load(json_file)
-
     # Filter measurements to only include data during steady-state periods
     filtered_measurements = FilteredMeasurements(measurements, steady_state_lists[slot_counter], start_working_time)
 
@@ -94,9 +80,12 @@ def simulation_pipeline(slot_counter, start_working_time):
 
     filtered_measurements.reset_attributes()
 
+    return steady_state_lists
 
+
+steady_state_lists = []
 for slot_counter, start_working_time in enumerate(start_working_times):
-    simulation_pipeline(slot_counter, start_working_time)
+    steady_state_lists = simulation_pipeline(slot_counter, start_working_time)
 
 # Salva il dizionario in un file JSON
 output_file_path = "./report_images/result_of_the_simulations_for_comparison.json"
@@ -105,4 +94,7 @@ with open(output_file_path, 'w') as json_file:
 
 # Generate various visualizations using the measurements and filtered steady-state data
 # Plot number of users over time with warm-up and steady-state periods highlighted
-results_visualization.plot_users_with_steady_state(measurements=measurements)
+results_visualization.plot_users_with_steady_state(measurements=measurements, steady_state_slots=steady_state_lists)
+
+# Summary of the kernel instrumentation (only if enabled, see lab2.KernelInstrumentation)
+lab2.print_instrumentation_summary()
@@ -1,8 +1,7 @@
 import random
-from queue import PriorityQueue
 import lab2
 import results_visualization
-from lab2 import (Event, evt_arrival, evt_departure, evt_recharge, evt_switch_off, clear_folder, overall_metrics,
+from lab2 import (Event, Simulator, clear_folder, overall_metrics,
                   working_time_by_schedule_and_recharges, calculate_working_cycles)
 from utils.queues import MMmB
 import json
@@ -47,21 +46,9 @@ def run_simulation(scheduling_key):
     # Simulation logic (same as before)
     random.seed(42)
 
-    time = 0
-    FES = PriorityQueue()
-    FES.put((0, Event.ARRIVAL, None, None))
-
-    while time < variables['SIM_TIME']:
-        (time, event_type, drone_id, arg) = FES.get()
-
-        if event_type == Event.ARRIVAL:
-            evt_arrival(time, FES)
-        elif event_type == Event.DEPARTURE:
-            evt_departure(time, FES, drone_id, arg)
-        elif event_type == Event.SWITCH_OFF:
-            evt_switch_off(time, FES, drone_id, arg)
-        elif event_type == Event.RECHARGE:
-            evt_recharge(time, drone_id)
+    simulator = Simulator(start_time=0)
+    simulator.schedule(0, Event.ARRIVAL)
+    simulator.run(until=variables['SIM_TIME'])
 
     results_dict["WORKING SCHEDULE" + " " + scheduling_key] = overall_metrics(data, working_time, working_cycles)
 
@@ -80,3 +67,6 @@ with open(output_file_path, 'w') as json_file:
     json.dump(results_dict, json_file, indent=4)
 
 results_visualization.plot_simulation_data(output_file_path)
+
+# Summary of the kernel instrumentation (only if enabled, see lab2.KernelInstrumentation)
+lab2.print_instrumentation_summary()
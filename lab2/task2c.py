@@ -1,86 +1,117 @@
 import json
-import random
-from queue import PriorityQueue
 
 import results_visualization
 import lab2
-from lab2 import (Event, evt_arrival, evt_departure, evt_recharge, evt_switch_off, clear_folder, overall_metrics,
+from lab2 import (Event, SimulationContext, Simulator, clear_folder, overall_metrics, run_forked_variants,
                   working_time_by_schedule_and_recharges, calculate_working_cycles)
+from sweep import MAX_WORKERS, expand_grid, run_replications, run_sweep
+from utils.output_analysis import summarize_replications
 from utils.queues import MMmB
 
-# Clear the folder where report images will be stored to ensure fresh output.
-clear_folder('./report_images')
-
 # Initialize variables and configurations for the simulation
 lab2.init_variables("TASK2")
 variables = lab2.variables
-MMms = lab2.MMms
-measurements = lab2.measurements
-data = lab2.data
+# reused by all the simulations run by this process
+context = SimulationContext(variables=variables)
+
+# Number of independent replications of each simulation: with more than one, the saved results are the
+# means of the replications, and their confidence intervals are saved as well
+REPLICATIONS = 1
+SEED = 42
+CONFIDENCE_LEVEL = 0.95
+
+
+def recharges_limit(max_recharges):
+    return float('inf') if max_recharges == "inf" else max_recharges
+
 
-# Initialize a dictionary to store the departure rate results
-results_dict = {}
+def recharge_constraint_variant(max_recharges):
+    """
+    The simulations with different RECHARGE_CONSTRAINT values are identical
+    until the drone has completed 'max_recharges' recharges: then this
+    constraint diverges from the higher ones.
+    """
+    def diverges(ctx):
+        return ctx.MMms[0].battery.complete_cycles >= max_recharges
 
+    def configure(ctx):
+        ctx.MMms[0].maximum_recharge_cycles = max_recharges
 
-# Function to run the simulation for a given WORKING_SCHEDULING configuration
-def run_simulation(scheduling_key, recharging_key):
+    return None if max_recharges == "inf" else diverges, configure
+
+
+# Function to run the simulations of all the RECHARGE_CONSTRAINT values for a given WORKING_SCHEDULING configuration
+def run_simulation(scheduling_key, rng=None):
+
+    # Reset metrics at each simulation
+    context.reset(seed=SEED, rng=rng)  # Set a seed for reproducibility, unless replicating
 
     working_schedule_lists = variables["WORKING_SCHEDULING"][scheduling_key]
-    max_recharges = variables["RECHARGE_CONSTRAINT"][recharging_key]
 
     drone = variables["drone_types"]['A']  # Get drone specifications from configuration
     power_supply = drone["POW"]
 
-    # Calculate total working time for the current WORKING_SCHEDULING and MAX RECHARGES
-    working_time = working_time_by_schedule_and_recharges(max_recharges, working_schedule_lists, power_supply)
-    working_cycles = calculate_working_cycles(max_recharges, power_supply, working_schedule_lists)
-
     # Initialize an MMmB object for each drone type with its properties like power,
     # service rate, and buffer size
-    MMms[0] = MMmB(
+    context.MMms[0] = MMmB(
         power_supply=drone['POW'],  # Power supply of the drone
         service_times=[1 / (variables['BASE_SERVICE_RATE'] * drone['SERVICE_RATE'])],
         buffer_size=variables['BASE_BUFFER_SIZE'] * drone['BUFFER_SIZE'],  # Buffer size is multiplied by drone's factor
-        maximum_recharge_cycles=variables["RECHARGE_CONSTRAINT"][recharging_key],
-        # Max number of recharge cycles for the drone
+        maximum_recharge_cycles="inf",  # Set by each variant, when it diverges from the others
         working_slots=variables["WORKING_SCHEDULING"][scheduling_key]  # Time intervals when the drone is operational
     )
 
-    # Simulation logic (same as before)
-    random.seed(42)
-    time = variables['SIM_START']
-    FES = PriorityQueue()
-    FES.put((time, Event.ARRIVAL, None, None))
-
-    while time < variables['SIM_START'] + variables['SIM_TIME']:
-        (time, event_type, drone_id, arg) = FES.get()
-
-        if event_type == Event.ARRIVAL:
-            evt_arrival(time, FES)
-        elif event_type == Event.DEPARTURE:
-            evt_departure(time, FES, drone_id, arg)
-        elif event_type == Event.SWITCH_OFF:
-            evt_switch_off(time, FES, drone_id, arg)
-        elif event_type == Event.RECHARGE:
-            evt_recharge(time, drone_id)
-
-    results_dict[scheduling_key + " " + str(max_recharges)] = overall_metrics(data, working_time, working_cycles)
-
-# Run the simulation for each WORKING_SCHEDULING and RECHARGE_CONSTRAINT configuration
-for scheduling_key in variables[f"WORKING_SCHEDULING"]:
-    for recharging_key in variables["RECHARGE_CONSTRAINT"]:
-
-        # Reset metrics at each simulation
-        lab2.init_simulation_environment()
-        measurements = lab2.measurements
-        data = lab2.data
-
-        # Run the simulation and get the results
-        run_simulation(scheduling_key, recharging_key)
-
-# Salva il dizionario in un file JSON
-output_file_path = "./report_images/result_task_2_c.json"
-with open(output_file_path, 'w') as json_file:
-    json.dump(results_dict, json_file, indent=4)
-
-results_visualization.plot_metric_recharges(results_dict, metric="Departures Percentage")
+    # Simulation logic (same as before): the history shared by the RECHARGE_CONSTRAINT values is simulated once,
+    # and each one of them continues from a copy of it, in the order in which they diverge
+    simulator = Simulator(start_time=variables['SIM_START'], ctx=context)
+    simulator.schedule(variables['SIM_START'], Event.ARRIVAL)
+    all_max_recharges = sorted(variables["RECHARGE_CONSTRAINT"].values(), key=recharges_limit)
+    simulators = run_forked_variants(simulator, variables['SIM_START'] + variables['SIM_TIME'],
+                                     [recharge_constraint_variant(max_recharges) for max_recharges in all_max_recharges])
+    data_by_max_recharges = {max_recharges: variant.ctx.data
+                             for max_recharges, variant in zip(all_max_recharges, simulators)}
+
+    results = []
+    for max_recharges in variables["RECHARGE_CONSTRAINT"].values():
+        # Calculate total working time for the current WORKING_SCHEDULING and MAX RECHARGES
+        working_time = working_time_by_schedule_and_recharges(max_recharges, working_schedule_lists, power_supply)
+        working_cycles = calculate_working_cycles(max_recharges, power_supply, working_schedule_lists)
+        results.append((scheduling_key + " " + str(max_recharges),
+                        overall_metrics(data_by_max_recharges[max_recharges], working_time, working_cycles)))
+    return results
+
+
+if __name__ == '__main__':
+    # Clear the folder where report images will be stored to ensure fresh output.
+    clear_folder('./report_images')
+
+    # Run the simulations for each WORKING_SCHEDULING (each one for all the RECHARGE_CONSTRAINT configurations),
+    # in parallel
+    grid = expand_grid(scheduling_key=variables["WORKING_SCHEDULING"])
+    if REPLICATIONS > 1:
+        replications = run_replications(run_simulation, grid, "TASK2", REPLICATIONS, seed=SEED,
+                                        max_workers=MAX_WORKERS)
+        results_dict = {}
+        confidence_intervals_dict = {}
+        for scheduling_results in replications:
+            # from the results of each replication, to the replications of each RECHARGE_CONSTRAINT
+            for results in zip(*scheduling_results):
+                key = results[0][0]
+                confidence_intervals_dict[key] = summarize_replications([metrics for _, metrics in results],
+                                                                        CONFIDENCE_LEVEL)
+                results_dict[key] = {metric: ci['Mean'] for metric, ci in confidence_intervals_dict[key].items()}
+        with open("./report_images/result_task_2_c_confidence_intervals.json", 'w') as json_file:
+            json.dump(confidence_intervals_dict, json_file, indent=4)
+    else:
+        results_dict = dict(result for results in run_sweep(run_simulation, grid, "TASK2", max_workers=MAX_WORKERS)
+                            for result in results)
+
+    # Salva il dizionario in un file JSON
+    output_file_path = "./report_images/result_task_2_c.json"
+    with open(output_file_path, 'w') as json_file:
+        json.dump(results_dict, json_file, indent=4)
+
+    results_visualization.plot_metric_recharges(results_dict, metric="Departures Percentage")
+
+    # Summary of the kernel instrumentation (only if enabled, see lab2.KernelInstrumentation)
+    lab2.print_instrumentation_summary()
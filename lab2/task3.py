@@ -1,10 +1,9 @@
 import json
 import random
-from queue import PriorityQueue
 
 import results_visualization
 import lab2
-from lab2 import (Event, evt_arrival, evt_departure, evt_recharge, evt_switch_off, clear_folder, overall_metrics,
+from lab2 import (Event, Simulator, clear_folder, overall_metrics,
                   calculate_working_cycles, working_time_by_schedule_and_recharges)
 from utils.queues import MMmB
 
@@ -49,21 +48,9 @@ def run_simulation(scheduling_key, configuration):
 
     # Simulation logic (same as before)
     random.seed(42)
-    time = variables['SIM_START']
-    FES = PriorityQueue()
-    FES.put((time, Event.ARRIVAL, None, None))
-
-    while time < variables['SIM_START'] + variables['SIM_TIME']:
-        (time, event_type, drone_id, arg) = FES.get()
-
-        if event_type == Event.ARRIVAL:
-            evt_arrival(time, FES)
-        elif event_type == Event.DEPARTURE:
-            evt_departure(time, FES, drone_id, arg)
-        elif event_type == Event.SWITCH_OFF:
-            evt_switch_off(time, FES, drone_id, arg)
-        elif event_type == Event.RECHARGE:
-            evt_recharge(time, drone_id)
+    simulator = Simulator(start_time=variables['SIM_START'])
+    simulator.schedule(variables['SIM_START'], Event.ARRIVAL)
+    simulator.run(until=variables['SIM_START'] + variables['SIM_TIME'])
 
     results_dict[power_supply + " " + scheduling_key] = overall_metrics(data, working_time, working_cycles)
 
@@ -87,3 +74,6 @@ with open(output_file_path, 'w') as json_file:
 results_visualization.plot_metric_by_power_supply(results_dict,
                                                   metric="Departures Percentage",
                                                   max_recharges=max_recharges)
+
+# Summary of the kernel instrumentation (only if enabled, see lab2.KernelInstrumentation)
+lab2.print_instrumentation_summary()
@@ -1,29 +1,30 @@
 import json
-import random
-from queue import PriorityQueue
 
-import results_visualization
 import lab2
-from lab2 import (Event, evt_arrival, evt_departure, evt_recharge, evt_switch_off, clear_folder, overall_metrics,
-                  calculate_working_cycles, working_time_by_schedule_and_recharges, sort_by_departure_percentage)
+from lab2 import (Event, SimulationContext, Simulator, clear_folder, overall_metrics,
+                  calculate_working_cycles, working_time_by_schedule_and_recharges)
+from sweep import MAX_WORKERS, expand_grid, run_replications, run_sweep
+from utils.output_analysis import summarize_replications
 from utils.queues import MMmB
 
-# Clear the folder where report images will be stored to ensure fresh output.
-clear_folder('./report_images')
-
 # Initialize variables and configurations for the simulation
 lab2.init_variables("TASK3")
 variables = lab2.variables
-MMms = lab2.MMms
-measurements = lab2.measurements
-data = lab2.data
+# reused by all the simulations run by this process
+context = SimulationContext(variables=variables)
 
-# Initialize a dictionary to store the departure rate results
-results_dict = {}
+# Number of independent replications of each simulation: with more than one, the saved results are the
+# means of the replications, and their confidence intervals are saved as well
+REPLICATIONS = 1
+SEED = 42
+CONFIDENCE_LEVEL = 0.95
 
 
 # Function to run the simulation for a given WORKING_SCHEDULING configuration
-def run_simulation(configuration, scheduling_key, recharging_key):
+def run_simulation(configuration, scheduling_key, recharging_key, rng=None):
+
+    # Reset metrics at each simulation
+    context.reset(seed=SEED, rng=rng)  # Set a seed for reproducibility, unless replicating
 
     max_recharges = variables["RECHARGE_CONSTRAINT"][recharging_key]
     working_schedule_lists = variables["WORKING_SCHEDULING"][scheduling_key]
@@ -37,7 +38,7 @@ def run_simulation(configuration, scheduling_key, recharging_key):
 
     # Initialize an MMmB object for each drone type with its properties like power,
     # service rate, and buffer size
-    MMms[0] = MMmB(
+    context.MMms[0] = MMmB(
         power_supply=power_supply,  # Power supply of the drone
         service_times=[1 / (variables['BASE_SERVICE_RATE'] * drone['SERVICE_RATE'])],
         buffer_size=variables['BASE_BUFFER_SIZE'] * drone['BUFFER_SIZE'],  # Buffer size is multiplied by drone's factor
@@ -47,39 +48,41 @@ def run_simulation(configuration, scheduling_key, recharging_key):
     )
 
     # Simulation logic (same as before)
-    random.seed(42)
-    time = variables['SIM_START']
-    FES = PriorityQueue()
-    FES.put((time, Event.ARRIVAL, None, None))
-
-    while time < variables['SIM_START'] + variables['SIM_TIME']:
-        (time, event_type, drone_id, arg) = FES.get()
-
-        if event_type == Event.ARRIVAL:
-            evt_arrival(time, FES)
-        elif event_type == Event.DEPARTURE:
-            evt_departure(time, FES, drone_id, arg)
-        elif event_type == Event.SWITCH_OFF:
-            evt_switch_off(time, FES, drone_id, arg)
-        elif event_type == Event.RECHARGE:
-            evt_recharge(time, drone_id)
-
-    results_dict[power_supply + " " + scheduling_key + " " + str(max_recharges)] = overall_metrics(data, working_time, working_cycles)
-
-# Run the simulation for each WORKING_SCHEDULING and RECHARGE_CONSTRAINT configuration
-for configuration in variables["configurations"]:
-    for scheduling_key in variables[f"WORKING_SCHEDULING"]:
-        for recharging_key in variables["RECHARGE_CONSTRAINT"]:
-
-            # Reset metrics at each simulation
-            lab2.init_simulation_environment()
-            measurements = lab2.measurements
-            data = lab2.data
-
-            # Run the simulation and get the results
-            run_simulation(configuration, scheduling_key, recharging_key)
-
-# Salva il dizionario in un file JSON
-output_file_path = "./report_images/result_task_3_plus.json"
-with open(output_file_path, 'w') as json_file:
-    json.dump(results_dict, json_file, indent=4)
\ No newline at end of file
+    simulator = Simulator(start_time=variables['SIM_START'], ctx=context)
+    simulator.schedule(variables['SIM_START'], Event.ARRIVAL)
+    simulator.run(until=variables['SIM_START'] + variables['SIM_TIME'])
+
+    return (power_supply + " " + scheduling_key + " " + str(max_recharges),
+            overall_metrics(context.data, working_time, working_cycles))
+
+
+if __name__ == '__main__':
+    # Clear the folder where report images will be stored to ensure fresh output.
+    clear_folder('./report_images')
+
+    # Run the simulation for each WORKING_SCHEDULING and RECHARGE_CONSTRAINT configuration, in parallel
+    grid = expand_grid(configuration=variables["configurations"],
+                       scheduling_key=variables["WORKING_SCHEDULING"],
+                       recharging_key=variables["RECHARGE_CONSTRAINT"])
+    if REPLICATIONS > 1:
+        replications = run_replications(run_simulation, grid, "TASK3", REPLICATIONS, seed=SEED,
+                                        max_workers=MAX_WORKERS)
+        results_dict = {}
+        confidence_intervals_dict = {}
+        for results in replications:
+            key = results[0][0]
+            confidence_intervals_dict[key] = summarize_replications([metrics for _, metrics in results],
+                                                                    CONFIDENCE_LEVEL)
+            results_dict[key] = {metric: ci['Mean'] for metric, ci in confidence_intervals_dict[key].items()}
+        with open("./report_images/result_task_3_plus_confidence_intervals.json", 'w') as json_file:
+            json.dump(confidence_intervals_dict, json_file, indent=4)
+    else:
+        results_dict = dict(run_sweep(run_simulation, grid, "TASK3", max_workers=MAX_WORKERS))
+
+    # Salva il dizionario in un file JSON
+    output_file_path = "./report_images/result_task_3_plus.json"
+    with open(output_file_path, 'w') as json_file:
+        json.dump(results_dict, json_file, indent=4)
+
+    # Summary of the kernel instrumentation (only if enabled, see lab2.KernelInstrumentation)
+    lab2.print_instrumentation_summary()
\ No newline at end of file
@@ -1,9 +1,11 @@
-import random
-from queue import PriorityQueue
+import os
+
 import lab2
 import results_visualization
-from lab2 import Event, evt_arrival, evt_departure, evt_recharge, evt_switch_off
+from lab2 import Event, SimulationContext, Simulator, load_checkpoint
+from sweep import MAX_WORKERS, expand_grid, run_sweep
 from utils.measurements import Measurement, Measurements
+from utils.output_analysis import paired_confidence_interval
 from utils.queues import MMmB
 
 lab2.init_variables('TASK4')
@@ -18,41 +20,47 @@ specific_simulations = {
 }
 want_print_results = True
 want_plot_results = False
+# every role (arrivals, dispatch, service of each antenna) draws from its own random stream, so that all the
+# configurations are compared on the same arrivals and service times
+COMMON_RANDOM_NUMBERS = True
+# replications of each simulation, with seeds 0 .. REPLICATIONS - 1: with more than one, each configuration is
+# compared to the best ranked one with paired confidence intervals
+REPLICATIONS = 1
+CONFIDENCE_LEVEL = 0.95
+# simulated seconds between two checkpoints of each simulation (None: no checkpoints): if the sweep is interrupted,
+# running it again resumes each simulation from its last checkpoint
+CHECKPOINT_INTERVAL = None
+CHECKPOINT_FOLDER = './checkpoints'
 scores = {}
+# reused by all the simulations run by this process
+context = SimulationContext(variables=variables)
 
 
-def run_simulation(working_slots, drones_configuration, seed=0):
-    lab2.init_simulation_environment()
-    MMms = lab2.MMms
-    data = lab2.data
-    measurements = lab2.measurements
-    for i, drone_type in enumerate(drones_configuration):
-        drone = drone_types[drone_type]
-        MMms[i] = MMmB(power_supply=drone['POW'],
-                       service_times=[1 / (variables['BASE_SERVICE_RATE'] * drone['SERVICE_RATE'])
-                                      for m in range(drone['m_ANTENNAS'])],
-                       buffer_size=variables['BASE_BUFFER_SIZE'] * drone['BUFFER_SIZE'],
-                       working_slots=working_slots)
-    random.seed(seed)
-    # the simulation time
-    time = variables['SIM_START']
-    # the list of events in the form: (time, evt_type, drone_id*, additional_parameters*)
-    # * -> if needed
-    FES = PriorityQueue()
-    # schedule the first arrival at t=0, in order to make the simulation start.
-    FES.put((variables['SIM_START'], Event.ARRIVAL, None, None))
+def run_simulation(working_slots, drones_configuration, seed=0, checkpoint_path=None):
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        # resume the simulation from its last checkpoint
+        simulator = Simulator(ctx=load_checkpoint(checkpoint_path), resume=True)
+    else:
+        context.reset(seed=seed, common_random_numbers=COMMON_RANDOM_NUMBERS)
+        for i, drone_type in enumerate(drones_configuration):
+            drone = drone_types[drone_type]
+            context.MMms[i] = MMmB(power_supply=drone['POW'],
+                                   service_times=[1 / (variables['BASE_SERVICE_RATE'] * drone['SERVICE_RATE'])
+                                                  for m in range(drone['m_ANTENNAS'])],
+                                   buffer_size=variables['BASE_BUFFER_SIZE'] * drone['BUFFER_SIZE'],
+                                   working_slots=working_slots)
+        simulator = Simulator(start_time=variables['SIM_START'], ctx=context)
+        # schedule the first arrival at t=SIM_START, in order to make the simulation start.
+        simulator.schedule(variables['SIM_START'], Event.ARRIVAL)
     # simulate until the simulated time reaches a constant
-    while time < variables['SIM_START'] + variables['SIM_TIME']:
-        (time, event_type, drone_id, arg) = FES.get()
-        if event_type == Event.ARRIVAL:
-            evt_arrival(time, FES)
-        elif event_type == Event.DEPARTURE:
-            evt_departure(time, FES, drone_id, arg)
-        elif event_type == Event.SWITCH_OFF:
-            evt_switch_off(time, FES, drone_id, arg)
-        elif event_type == Event.RECHARGE:
-            evt_recharge(time, drone_id)
-    return data, measurements
+    until = variables['SIM_START'] + variables['SIM_TIME']
+    if checkpoint_path is None:
+        simulator.run(until=until)
+    else:
+        simulator.run_with_checkpoints(until, checkpoint_path, CHECKPOINT_INTERVAL)
+        # the simulation is complete: a new sweep has to start it from scratch
+        os.remove(checkpoint_path)
+    return simulator.ctx.data, simulator.ctx.measurements
 
 
 def generate_score_from_measurement(data: Measurement):
@@ -93,6 +101,26 @@ def evaluate_overall_scores():
         scores[configuration]['score_position'] = score_pos + 1
 
 
+def compare_with_best(replications):
+    """
+    Prints the paired confidence intervals of the differences between the
+    metrics of each configuration and the ones of the best ranked one, over
+    their replications (run with the same seeds).
+    """
+    best = min(scores, key=lambda configuration: scores[configuration]['score_position'])
+    for configuration, results in replications.items():
+        if configuration == best:
+            continue
+        print('\nConfiguration \'{:s}\' compared to \'{:s}\' ({:d} paired replications):'.format(
+            configuration, best, len(results)))
+        for metric in ('departures_fraction', 'average_delay', 'charging_cycles'):
+            difference, lower, upper = paired_confidence_interval([result[metric] for result in results],
+                                                                  [result[metric] for result in replications[best]],
+                                                                  CONFIDENCE_LEVEL)
+            print('  {:s} difference: {:f} ({:.0f}% CI: [{:f}, {:f}])'.format(
+                metric, difference, CONFIDENCE_LEVEL * 100, lower, upper))
+
+
 def plot_results(measurements: Measurements):
     results_visualization.plot_users(measurements)
     # results_visualization.plot_arrivals(measurements)
@@ -113,20 +141,35 @@ if __name__ == '__main__':
     else:
         drones_configurations = specific_simulations['drones_configurations']
         working_slots = specific_simulations['working_slots']
-    for drones_configuration in drones_configurations:
-        for working_scheduling in working_slots:
-            print('\nRunning simulation with drones configuration \'{:s}\' and scheduling strategy \'{:s}\''.format(
-                drones_configuration, working_scheduling))
-            data, measurements = run_simulation(working_slots=variables['WORKING_SCHEDULING'][working_scheduling],
-                                                drones_configuration=variables['configurations'][drones_configuration])
-            scores[drones_configuration] = generate_score_from_measurement(data)
-            # NOTE: DO NOT DELETE THESE COMMENTS!!!
-            # Note: these two lines below were used to understand which scheduling strategy is the most suitable,
-            # while 'scores' makes sense only with the assumption that only one scheduling strategy is applied
-            # if want_print_results:
-            #     results_visualization.print_results(data)
-            if want_plot_results:
-                plot_results(measurements)
+    # every simulation is independent from the others, so they are run in parallel
+    grid = expand_grid(drones_configuration=drones_configurations, working_scheduling=working_slots,
+                       seed=range(REPLICATIONS))
+    if CHECKPOINT_INTERVAL is not None:
+        os.makedirs(CHECKPOINT_FOLDER, exist_ok=True)
+    results = run_sweep(run_simulation, [{
+        'working_slots': variables['WORKING_SCHEDULING'][params['working_scheduling']],
+        'drones_configuration': variables['configurations'][params['drones_configuration']],
+        'seed': params['seed'],
+        'checkpoint_path': None if CHECKPOINT_INTERVAL is None else os.path.join(
+            CHECKPOINT_FOLDER, 'task4_{drones_configuration}_{working_scheduling}_{seed}.pkl.gz'.format(**params))
+    } for params in grid], 'TASK4', max_workers=MAX_WORKERS)
+    replications = {}
+    for params, (data, measurements) in zip(grid, results):
+        drones_configuration = params['drones_configuration']
+        working_scheduling = params['working_scheduling']
+        replications.setdefault(drones_configuration, []).append(generate_score_from_measurement(data))
+        if params['seed'] != 0:
+            continue
+        print('\nRunning simulation with drones configuration \'{:s}\' and scheduling strategy \'{:s}\''.format(
+            drones_configuration, working_scheduling))
+        scores[drones_configuration] = generate_score_from_measurement(data)
+        # NOTE: DO NOT DELETE THESE COMMENTS!!!
+        # Note: these two lines below were used to understand which scheduling strategy is the most suitable,
+        # while 'scores' makes sense only with the assumption that only one scheduling strategy is applied
+        # if want_print_results:
+        #     results_visualization.print_results(data)
+        if want_plot_results:
+            plot_results(measurements)
     evaluate_overall_scores()
     if want_print_results:
         for drones_configuration in drones_configurations:
@@ -134,3 +177,8 @@ if __name__ == '__main__':
             results_visualization.print_results(scores[drones_configuration]['complete_results'])
             print('Overall score: {:f}'.format(scores[drones_configuration]['overall_score']))
             print('Ranking position (based on overall score): ', scores[drones_configuration]['score_position'])
+        if REPLICATIONS > 1:
+            compare_with_best(replications)
+
+    # Summary of the kernel instrumentation (only if enabled, see lab2.KernelInstrumentation)
+    lab2.print_instrumentation_summary()
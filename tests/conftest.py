@@ -0,0 +1,6 @@
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the lab2 modules import each other by name, as when the lab2 scripts are run
+sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, 'lab2')]
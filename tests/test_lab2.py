@@ -0,0 +1,48 @@
+import pytest
+
+from lab2 import SimulationContext, Simulator, evt_switch_off, request_drone, send_drone
+from utils.queues import MMmB, Packet
+
+
+def _drone_serving(packets, start_time=0):
+    """
+    A context with a single battery drone, switched on at the start time,
+    holding the given number of packets, the first of them in service.
+    """
+    ctx = SimulationContext()
+    ctx.MMms[0] = MMmB(power_supply="BAT", service_times=[60.0], buffer_size=10, working_slots=[[0, 86400]])
+    Simulator(start_time=start_time, ctx=ctx)
+    send_drone(ctx, start_time, 0)
+    drone = ctx.MMms[0]
+    for _ in range(packets):
+        drone.insert(Packet(arrival_time=start_time))
+        ctx.data.users += 1
+    drone.engage_server()
+    return ctx
+
+
+@pytest.mark.parametrize('tot_time', [100, 25 * 60])
+def test_switch_off_removes_all_users(tot_time):
+    # 100 s leave energy in the battery (paused), 25 min empty it
+    ctx = _drone_serving(packets=3)
+    evt_switch_off(ctx, tot_time, 0, tot_time)
+    assert ctx.data.users == 0
+    assert ctx.data.losses == 1
+    assert ctx.data.users_moments.mean == pytest.approx(3)
+
+
+def test_users_statistics_start_at_start_time():
+    ctx = _drone_serving(packets=3, start_time=8 * 3600)
+    evt_switch_off(ctx, 8 * 3600 + 100, 0, 100)
+    assert ctx.data.users_moments.total_time == pytest.approx(100)
+    assert ctx.data.users_moments.mean == pytest.approx(3)
+
+
+def test_ready_drones_follow_replaced_drones():
+    # as in task1_pipeline, the drone is replaced by a new one for the next run
+    ctx = _drone_serving(packets=1)
+    evt_switch_off(ctx, 25 * 60, 0, 25 * 60)
+    assert request_drone(ctx, 25 * 60) is None
+    ctx.MMms[0] = MMmB(power_supply="BAT", service_times=[60.0], buffer_size=10, working_slots=[[0, 86400]])
+    Simulator(ctx=ctx)
+    assert request_drone(ctx, 0) == 0
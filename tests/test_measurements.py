@@ -0,0 +1,39 @@
+import numpy as np
+
+from lab2 import Event, SimulationContext, Simulator
+from utils.measurements import StreamedMeasurements
+from utils.queues import MMmB
+from utils.random_streams import RandomStream
+
+
+def _short_run(stream_path):
+    """
+    A run of a single drone, always in service, much shorter than a chunk of
+    StreamingMeasurements.
+    """
+    ctx = SimulationContext(variables={'ARRIVAL_RATE': 2}, rng=RandomStream(42), stream_path=stream_path)
+    ctx.MMms[0] = MMmB(power_supply="INF", service_times=[0.25], buffer_size=50, working_slots=[[0, 86400]])
+    simulator = Simulator(ctx=ctx)
+    simulator.schedule(0, Event.ARRIVAL)
+    simulator.run(until=1500)
+    return ctx
+
+
+def test_streamed_run_is_complete(tmp_path):
+    path = str(tmp_path / 'measurements.bin')
+    ctx = _short_run(path)
+    records = StreamedMeasurements(path).records
+    assert 1 < len(records) == ctx.measurements.record_count()
+    assert records['time'][-1] == ctx.data.time
+    assert records['arrivals'][-1] == ctx.data.arrivals > 0
+    assert np.all(np.diff(records['time']) >= 0)
+
+
+def test_reset_closes_the_stream(tmp_path):
+    path = str(tmp_path / 'measurements.bin')
+    ctx = _short_run(path)
+    # records added after the end of the run are written by reset
+    ctx.measurements.add_measurement(ctx.data)
+    count = ctx.measurements.record_count()
+    ctx.reset()
+    assert len(StreamedMeasurements(path).records) == count
@@ -0,0 +1,154 @@
+import math
+
+import numpy as np
+
+from utils.queues import MMmB
+
+# Closed form results of the queues simulated by the labs, used as a baseline
+# for the simulations. All the functions accept either a number or an array of
+# arrival rates, and return arrays of the same shape. The metrics are returned
+# in a dictionary with the keys:
+#   - loss_probability: probability that an arrival is discarded
+#   - average_users: mean number of packets in the system (queue and servers)
+#   - average_delay: mean time spent in the system by the served packets
+#   - utilization: fraction of time each server is busy
+
+
+def erlang_b(offered_load, servers):
+    """
+    Blocking probability of an M/M/m/m queue (Erlang-B formula), with
+    offered_load = arrival_rate * service_time. It is computed with the
+    recursion B(k) = A * B(k - 1) / (k + A * B(k - 1)), which is stable even
+    for large numbers of servers.
+    """
+    offered_load = np.asarray(offered_load, dtype=float)
+    blocking = np.ones_like(offered_load)
+    for k in range(1, servers + 1):
+        blocking = offered_load * blocking / (k + offered_load * blocking)
+    return blocking
+
+
+def erlang_c(offered_load, servers):
+    """
+    Probability of waiting of an M/M/m queue with infinite buffer (Erlang-C
+    formula). It is 1 when the queue is not stable (offered_load >= servers).
+    """
+    offered_load = np.asarray(offered_load, dtype=float)
+    blocking = erlang_b(offered_load, servers)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        waiting = servers * blocking / (servers - offered_load * (1 - blocking))
+    return np.where(offered_load < servers, waiting, 1.0)
+
+
+def _mmm_infinite(arrival_rate, service_time, servers):
+    offered_load = arrival_rate * service_time
+    utilization = offered_load / servers
+    stable = utilization < 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        waiting_time = erlang_c(offered_load, servers) * service_time / (servers - offered_load)
+        average_delay = np.where(stable, waiting_time + service_time, np.inf)
+    return {
+        'loss_probability': np.zeros_like(offered_load),
+        'average_users': arrival_rate * average_delay,
+        'average_delay': average_delay,
+        'utilization': np.minimum(utilization, 1.0)
+    }
+
+
+def _mmm_finite(arrival_rate, service_time, servers, capacity):
+    """
+    Stationary distribution of the birth-death chain of an M/M/m/K queue
+    (K = capacity >= servers), computed in the log domain for all the arrival
+    rates at once: p(n) is proportional to A^n / n! for n <= m, and to
+    A^n / (m! m^(n - m)) for n > m.
+    """
+    offered_load = arrival_rate * service_time
+    states = np.arange(capacity + 1)
+    served = np.minimum(states, servers)
+    log_denominators = (np.concatenate(([0.0], np.cumsum(np.log(np.arange(1, servers + 1)))))[served]
+                        + (states - served) * math.log(servers))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_load = np.log(offered_load)[..., np.newaxis]
+        log_weights = np.where(states == 0, 0.0, states * log_load) - log_denominators
+    weights = np.exp(log_weights - log_weights.max(axis=-1, keepdims=True))
+    probabilities = weights / weights.sum(axis=-1, keepdims=True)
+
+    loss_probability = probabilities[..., capacity]
+    average_users = (probabilities * states).sum(axis=-1)
+    throughput = arrival_rate * (1 - loss_probability)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        average_delay = np.where(throughput > 0, average_users / throughput, service_time)
+    return {
+        'loss_probability': loss_probability,
+        'average_users': average_users,
+        'average_delay': average_delay,
+        'utilization': throughput * service_time / servers
+    }
+
+
+def mmm_metrics(arrival_rate, service_time, servers=1, buffer_size=float('inf')):
+    """
+    Metrics of an M/M/m queue with the buffer semantics of MMmB: buffer_size
+    is the maximum number of packets in the system (in service too), and a
+    buffer_size of 0 means that there's no waiting room, i.e. the packets are
+    only accepted when a server is free (Erlang loss system).
+    """
+    arrival_rate = np.asarray(arrival_rate, dtype=float)
+    if math.isinf(buffer_size):
+        return _mmm_infinite(arrival_rate, service_time, servers)
+    if buffer_size == 0:
+        return _mmm_finite(arrival_rate, service_time, servers, servers)
+    # with a buffer smaller than the number of servers, only buffer_size servers can be busy
+    servers = min(servers, int(buffer_size))
+    return _mmm_finite(arrival_rate, service_time, servers, int(buffer_size))
+
+
+def mmmb_metrics(arrival_rate, queue: MMmB):
+    """
+    Metrics of the given MMmB, for exponential service times. Its servers
+    must all have the same mean service time.
+    """
+    service_times = {server.service_time for server in queue._servers.values()}
+    if len(service_times) != 1:
+        raise ValueError("The servers of the queue must have the same service time.")
+    buffer_size = float('inf') if queue.infinite_buffer else queue.buffer_size
+    return mmm_metrics(arrival_rate, service_times.pop(), len(queue._servers), buffer_size)
+
+
+def mg1_metrics(arrival_rate, service_mean, service_second_moment):
+    """
+    Metrics of an M/G/1 queue with infinite buffer, from the
+    Pollaczek-Khinchine formula: the mean waiting time in the queue is
+    arrival_rate * E[S^2] / (2 * (1 - utilization)).
+    """
+    arrival_rate = np.asarray(arrival_rate, dtype=float)
+    utilization = arrival_rate * service_mean
+    stable = utilization < 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        waiting_time = arrival_rate * service_second_moment / (2 * (1 - utilization))
+        average_delay = np.where(stable, waiting_time + service_mean, np.inf)
+    return {
+        'loss_probability': np.zeros_like(utilization),
+        'average_users': arrival_rate * average_delay,
+        'average_delay': average_delay,
+        'utilization': np.minimum(utilization, 1.0)
+    }
+
+
+def service_second_moment(distribution, service_mean):
+    """
+    E[S^2] of the service time distributions of lab1 (see generate_service_time
+    in lab1/task4.py), all with mean 'service_mean': exponential, uniform in
+    [0.5, 1.5] * mean, normal with standard deviation 0.2 * mean (its
+    truncation at 0 is negligible) and gamma with shape 2.
+    """
+    if distribution == "exponential":
+        return 2 * service_mean ** 2
+    elif distribution == "uniform":
+        return service_mean ** 2 * (1 + 1 / 12)
+    elif distribution == "normal":
+        return service_mean ** 2 * (1 + 0.2 ** 2)
+    elif distribution == "gamma":
+        return service_mean ** 2 * (1 + 1 / 2)
+    else:
+        raise ValueError(f"Distribution '{distribution}' is not supported.")
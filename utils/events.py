@@ -0,0 +1,155 @@
+import heapq
+from itertools import count
+
+
+def _get_state(fes):
+    # itertools.count can't be pickled (nor deep copied) by recent Python versions, so its next value is
+    # saved instead: only the order of the sequence numbers matters, so skipping one of them is harmless
+    state = fes.__dict__.copy()
+    state['_sequence'] = next(fes._sequence)
+    return state
+
+
+def _set_state(fes, state):
+    fes.__dict__.update(state)
+    fes._sequence = count(state['_sequence'])
+
+
+class EventCalendar:
+    """
+    Future Event Schedule (FES) backed by a binary heap.
+
+    It is a drop-in replacement for queue.PriorityQueue in the simulation loops:
+    events are put and got as tuples whose first element is the event time,
+    e.g. (time, Event.ARRIVAL, drone_id, arg). Unlike PriorityQueue no lock is
+    taken, and events scheduled at the same time are returned in insertion
+    order thanks to a monotonically increasing sequence number, so the rest of
+    the tuple is never compared.
+    """
+
+    __getstate__ = _get_state
+    __setstate__ = _set_state
+
+    def __init__(self):
+        self._heap = []
+        self._sequence = count()
+
+    def put(self, event):
+        heapq.heappush(self._heap, (event[0], next(self._sequence), event))
+
+    def get(self):
+        return heapq.heappop(self._heap)[2]
+
+    def empty(self):
+        return not self._heap
+
+    def qsize(self):
+        return len(self._heap)
+
+    def __len__(self):
+        return len(self._heap)
+
+
+class CalendarQueue:
+    """
+    Future Event Schedule implemented as a calendar queue (R. Brown, 1988).
+
+    Events are spread over an array of buckets ("days"), each one covering
+    'width' time units, and a dequeue scans the buckets of the current "year"
+    in order. The number of buckets doubles (halves) when the number of
+    pending events grows (shrinks) too much, and the bucket width is estimated
+    again from the separation of the earliest events, so that each bucket holds
+    only a few events: put/get are O(1) amortized, independently of how many
+    events are pending (e.g. the departures of a large drone fleet).
+
+    It has the same interface and the same FIFO tie-breaking of EventCalendar.
+    """
+
+    MIN_BUCKETS = 2
+    WIDTH_SAMPLE = 25
+
+    __getstate__ = _get_state
+    __setstate__ = _set_state
+
+    def __init__(self, buckets=MIN_BUCKETS, width=1.0):
+        self._sequence = count()
+        self._size = 0
+        self._last_time = 0.0
+        self._setup(buckets, width)
+
+    def _setup(self, buckets, width):
+        self._buckets = [[] for _ in range(buckets)]
+        self._n_buckets = buckets
+        self._width = width
+        # absolute index of the day being scanned, i.e. floor(time / width)
+        self._day = int(self._last_time // width)
+        self._grow_threshold = 2 * buckets
+        self._shrink_threshold = buckets // 2 - 2
+
+    def put(self, event):
+        time = event[0]
+        heapq.heappush(self._buckets[int(time // self._width) % self._n_buckets],
+                       (time, next(self._sequence), event))
+        self._size += 1
+        if self._size > self._grow_threshold:
+            self._resize(2 * self._n_buckets)
+
+    def get(self):
+        if not self._size:
+            raise IndexError('get from an empty CalendarQueue')
+        buckets = self._buckets
+        n_buckets = self._n_buckets
+        width = self._width
+        day = self._day
+        # scan the buckets of the current year, looking for an event of the right day
+        for _ in range(n_buckets):
+            bucket = buckets[day % n_buckets]
+            if bucket and int(bucket[0][0] // width) <= day:
+                break
+            day += 1
+        else:
+            # no event within a year: jump directly to the day of the earliest one
+            day = int(min(bucket[0] for bucket in buckets if bucket)[0] // width)
+            bucket = buckets[day % n_buckets]
+        entry = heapq.heappop(bucket)
+        self._day = day
+        self._last_time = entry[0]
+        self._size -= 1
+        if self._size < self._shrink_threshold and n_buckets > self.MIN_BUCKETS:
+            self._resize(n_buckets // 2)
+        return entry[2]
+
+    def _resize(self, buckets):
+        entries = [entry for bucket in self._buckets for entry in bucket]
+        self._setup(buckets, self._estimate_width(entries))
+        for entry in entries:
+            heapq.heappush(self._buckets[int(entry[0] // self._width) % buckets], entry)
+
+    def _estimate_width(self, entries):
+        """
+        Three times the average separation of the earliest events, ignoring
+        separations larger than twice the average (as in Brown's paper).
+        """
+        times = [entry[0] for entry in heapq.nsmallest(self.WIDTH_SAMPLE, entries)]
+        separations = [t2 - t1 for t1, t2 in zip(times, times[1:])]
+        if not separations:
+            return self._width
+        average = sum(separations) / len(separations)
+        separations = [s for s in separations if s <= 2 * average]
+        average = sum(separations) / len(separations)
+        return 3 * average if average > 0 else self._width
+
+    def empty(self):
+        return not self._size
+
+    def qsize(self):
+        return self._size
+
+    def __len__(self):
+        return self._size
+
+
+FES_BACKENDS = {
+    'heap': EventCalendar,
+    'calendar': CalendarQueue
+}
@@ -1,5 +1,15 @@
 import copy
+import math
+import operator
+import os
+from collections import namedtuple
+from collections.abc import Sequence
+from enum import Enum
+
 import matplotlib.pyplot as plt
+import numpy as np
+
+from utils.online_statistics import P2Quantile, RunningMoments, TimeWeightedMoments
 
 
 class Measurement:
@@ -21,6 +31,11 @@ class Measurement:
         self.total_users = 0
         self.working_interval = 25 * 60  # 25 minutes of work before recharging
         self.charging_cycles = 0  # Number of complete discharge/charge cycles
+        self.stale_events = 0  # Events of switched off drones, skipped without being handled
+        # Online statistics, updated in O(1) memory at each event
+        self.delay_moments = RunningMoments()  # Mean and variance of the delay of each packet
+        self.delay_quantiles = {p: P2Quantile(p) for p in (0.5, 0.95, 0.99)}  # P^2 estimates of the delay quantiles
+        self.users_moments = TimeWeightedMoments()  # Time-weighted mean and variance of the users in the system
 
         # TODO: da controllare - non tutti sono utilizzati
         self.average_delay = 0
@@ -36,15 +51,37 @@ class Measurement:
         # self.waiting_delays = []  # List of individual waiting delays for distribution
 
 
+class SamplingPolicy(Enum):
+    PER_EVENT = 1  # a measurement is stored for each event
+    EVERY_N_EVENTS = 2  # a measurement is stored every 'sampling_step' events
+    TIME_GRID = 3  # a measurement is stored every 'sampling_step' time units, carrying forward the last value
+
+
 class Measurements:
     """
     Represents the full collection of all the measurements taken over time. Used to gather
     information about how the simulation evolved and to plot the results.
+    For long simulations, a SamplingPolicy can be chosen so that not all the measurements
+    are stored: with TIME_GRID the history holds the state of the system at each point of
+    a fixed time grid, and its length is bounded by the horizon over the time step.
     """
 
-    def __init__(self):
+    def __init__(self, sampling=SamplingPolicy.PER_EVENT, sampling_step=1):
         self.history = [Measurement()]
         self._last_measurement = self.history[-1]
+        self._set_sampling(sampling, sampling_step)
+
+    def _set_sampling(self, sampling, sampling_step):
+        self.sampling = sampling
+        self.sampling_step = sampling_step
+        self._events_since_sample = 0
+        self._next_grid_point = None  # index of the next point of the time grid
+        self._previous = None  # snapshot of the last measurement, carried forward on the time grid
+        # the policy is resolved once here, instead of at each measurement
+        if sampling == SamplingPolicy.EVERY_N_EVENTS:
+            self.add_measurement = self._add_every_n_events
+        elif sampling == SamplingPolicy.TIME_GRID:
+            self.add_measurement = self._add_on_time_grid
 
     def get_last_measurement(self):
         return self._last_measurement
@@ -53,7 +90,293 @@ class Measurements:
         return self._last_measurement.time
 
     def add_measurement(self, measurement: Measurement):
-        self.history.append(copy.deepcopy(measurement))
+        self._append(self._snapshot(measurement))
+
+    def _add_every_n_events(self, measurement: Measurement):
+        self._events_since_sample += 1
+        if self._events_since_sample == self.sampling_step:
+            self._events_since_sample = 0
+            self._append(self._snapshot(measurement))
+
+    def _add_on_time_grid(self, measurement: Measurement):
+        """
+        Each point of the grid takes the state after the last measurement not later than it,
+        so it can be stored only when a measurement after it is received.
+        """
+        time = measurement.time
+        if self._previous is None:
+            self._next_grid_point = math.ceil(time / self.sampling_step)
+        else:
+            while self._next_grid_point * self.sampling_step < time:
+                self._append(self._previous, self._next_grid_point * self.sampling_step)
+                self._next_grid_point += 1
+        self._previous = self._snapshot(measurement)
+
+    def _snapshot(self, measurement: Measurement):
+        return copy.deepcopy(measurement)
+
+    def _append(self, snapshot, time=None):
+        if time is not None:
+            snapshot = copy.copy(snapshot)
+            snapshot.time = time
+        self.history.append(snapshot)
+
+    def column(self, field):
+        """
+        Returns the values of a field over time, as a NumPy array.
+        """
+        return np.array([getattr(measurement, field) for measurement in self.history])
+
+    def record_count(self):
+        """
+        Number of measurements in the history.
+        """
+        return len(self.history)
+
+    def flush(self):
+        """
+        Persists the measurements not stored yet: nothing to do here, since
+        the history is kept in memory (see StreamingMeasurements).
+        """
+
+
+# Fields of Measurement stored by ColumnarMeasurements, with the dtype of their column
+TRACKED_FIELDS = {
+    'time': np.float64,
+    'arrivals': np.int64,
+    'departures': np.int64,
+    'losses': np.int64,
+    'users': np.int64,
+    'drones': np.int64,
+    'charging_drones': np.int64,
+    'average_users': np.float64,
+    'delay': np.float64,
+    'total_users': np.int64,
+    'charging_cycles': np.int64
+}
+
+# Read-only snapshot of the tracked fields of a Measurement
+MeasurementRecord = namedtuple('MeasurementRecord', TRACKED_FIELDS.keys())
+
+
+class MeasurementsHistory(Sequence):
+    """
+    Read-only view over the columns of a ColumnarMeasurements (or of a streamed
+    file), behaving like the Measurements.history list: items are records (by
+    default MeasurementRecord) having the same attributes (time, users, ...) of
+    the corresponding Measurement.
+    """
+
+    def __init__(self, columns, record_type=MeasurementRecord):
+        self._columns = columns
+        self._record_type = record_type
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    def __getitem__(self, index):
+        make = self._record_type._make
+        if isinstance(index, slice):
+            return [make(row) for row in zip(*(column[index].tolist() for column in self._columns))]
+        return make(column[index].item() for column in self._columns)
+
+    def __iter__(self):
+        return map(self._record_type._make, zip(*(column.tolist() for column in self._columns)))
+
+
+class ColumnarMeasurements(Measurements):
+    """
+    Same as Measurements, but instead of deep copying the whole Measurement at
+    each event, only the TRACKED_FIELDS are stored, each one in its own NumPy
+    array. The arrays are preallocated and doubled when full, so adding a
+    measurement is amortized O(1) and creates no Python object.
+    """
+
+    def __init__(self, sampling=SamplingPolicy.PER_EVENT, sampling_step=1, capacity=1024):
+        self._size = 0
+        self._columns = [np.zeros(capacity, dtype=dtype) for dtype in TRACKED_FIELDS.values()]
+        self._get_tracked_fields = operator.attrgetter(*TRACKED_FIELDS.keys())
+        # as in Measurements, the history starts with an empty measurement
+        self._append(self._snapshot(Measurement()))
+        self._set_sampling(sampling, sampling_step)
+
+    @property
+    def history(self):
+        return MeasurementsHistory([column[:self._size] for column in self._columns])
+
+    def column(self, field):
+        """
+        Returns the values of a tracked field over time, as a NumPy array (no copy).
+        """
+        return self._columns[list(TRACKED_FIELDS.keys()).index(field)][:self._size]
+
+    def record_count(self):
+        return self._size
+
+    def get_last_measurement(self):
+        return self.history[-1]
+
+    def get_last_time(self):
+        return self._columns[0][self._size - 1].item()
+
+    def add_measurement(self, measurement: Measurement):
+        self._append(self._get_tracked_fields(measurement))
+
+    def _snapshot(self, measurement: Measurement):
+        return self._get_tracked_fields(measurement)
+
+    def _append(self, snapshot, time=None):
+        i = self._size
+        if i == len(self._columns[0]):
+            self._columns = [np.concatenate((column, np.zeros_like(column))) for column in self._columns]
+        for column, value in zip(self._columns, snapshot):
+            column[i] = value
+        if time is not None:
+            self._columns[0][i] = time
+        self._size = i + 1
+
+
+# Fixed-width binary record written by StreamingMeasurements
+STREAM_RECORD_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('arrivals', '<i8'),
+    ('departures', '<i8'),
+    ('losses', '<i8'),
+    ('users', '<i8'),
+    ('drones', '<i8'),
+    ('charging_drones', '<i8'),
+    ('delay', '<f8')
+])
+
+StreamRecord = namedtuple('StreamRecord', STREAM_RECORD_DTYPE.names)
+
+
+class StreamingMeasurements(Measurements):
+    """
+    Measurements appended to a file on disk as fixed-width binary records
+    (STREAM_RECORD_DTYPE), so that the history is never held in memory.
+    Records are collected in a chunk of 'chunk_size' records, which is written
+    with a single call when full: the event loop never blocks on small writes.
+    The last, partial chunk is written by flush (called by the Simulator at
+    the end of each run) or close (called by SimulationContext.reset, before
+    replacing the measurements).
+    The file can be read, also while the simulation is running, through
+    StreamedMeasurements (a np.memmap of the records already written).
+    """
+
+    def __init__(self, path, sampling=SamplingPolicy.PER_EVENT, sampling_step=1, chunk_size=65536):
+        self.path = path
+        self._file = open(path, 'wb')
+        self._chunk = np.zeros(chunk_size, dtype=STREAM_RECORD_DTYPE)
+        self._buffered = 0
+        self._written = 0
+        self._get_stream_fields = operator.attrgetter(*STREAM_RECORD_DTYPE.names)
+        # as in Measurements, the history starts with an empty measurement
+        self._append(self._snapshot(Measurement()))
+        self._set_sampling(sampling, sampling_step)
+
+    def add_measurement(self, measurement: Measurement):
+        self._append(self._get_stream_fields(measurement))
+
+    def _snapshot(self, measurement: Measurement):
+        return self._get_stream_fields(measurement)
+
+    def _append(self, snapshot, time=None):
+        i = self._buffered
+        self._chunk[i] = snapshot
+        if time is not None:
+            self._chunk['time'][i] = time
+        self._buffered = i + 1
+        if self._buffered == len(self._chunk):
+            self.flush()
+
+    def flush(self):
+        """
+        Writes the records collected so far to the file.
+        """
+        if self._buffered:
+            self._chunk[:self._buffered].tofile(self._file)
+            self._file.flush()
+            self._written += self._buffered
+            self._buffered = 0
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    def __getstate__(self):
+        """
+        The open file can't be pickled (e.g. in a checkpoint of the
+        simulation): the pending records are written, and only the number of
+        records in the file is kept.
+        """
+        self.flush()
+        state = self.__dict__.copy()
+        del state['_file']
+        return state
+
+    def __setstate__(self, state):
+        """
+        Reopens the file, dropping the records written after the state was
+        saved, so that the history goes on from there.
+        """
+        self.__dict__.update(state)
+        self._file = open(self.path, 'r+b')
+        self._file.truncate(self._written * STREAM_RECORD_DTYPE.itemsize)
+        self._file.seek(0, os.SEEK_END)
+
+    def open_reader(self):
+        """
+        Flushes the pending records and returns a StreamedMeasurements over the file.
+        """
+        self.flush()
+        return StreamedMeasurements(self.path)
+
+    @property
+    def history(self):
+        return self.open_reader().history
+
+    def record_count(self):
+        return self._written + self._buffered
+
+    def column(self, field):
+        return self.open_reader().column(field)
+
+    def get_last_measurement(self):
+        return self.history[-1]
+
+    def get_last_time(self):
+        return self.get_last_measurement().time
+
+
+class StreamedMeasurements(Measurements):
+    """
+    Read-only measurements loaded from a file written by StreamingMeasurements.
+    The file is memory-mapped, so only the pages actually accessed are read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = np.memmap(path, dtype=STREAM_RECORD_DTYPE, mode='r')
+
+    @property
+    def history(self):
+        return MeasurementsHistory([self.records[field] for field in STREAM_RECORD_DTYPE.names], StreamRecord)
+
+    def column(self, field):
+        return self.records[field]
+
+    def record_count(self):
+        return len(self.records)
+
+    def get_last_measurement(self):
+        return self.history[-1]
+
+    def get_last_time(self):
+        return self.records['time'][-1].item()
+
+    def add_measurement(self, measurement: Measurement):
+        raise TypeError('StreamedMeasurements are read-only')
 
 
 class FilteredMeasurements(Measurement, Measurements):
@@ -0,0 +1,135 @@
+import math
+
+
+class RunningMoments:
+    """
+    Mean and variance of a stream of observations, updated in O(1) time and
+    memory with Welford's algorithm (numerically stable, unlike the sum of
+    squares).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0  # sum of the squared deviations from the mean
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        """
+        Sample variance (n - 1 at the denominator).
+        """
+        return self._m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class TimeWeightedMoments:
+    """
+    Mean and variance of a piecewise-constant quantity (e.g. the number of
+    users in the system), each value being weighted by how long it lasted.
+    Updated in O(1) with the weighted version of Welford's algorithm.
+    """
+
+    def __init__(self):
+        self.total_time = 0.0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value, duration):
+        """
+        Accounts for 'value' having been held for 'duration' time units.
+        """
+        if duration <= 0:
+            return
+        self.total_time += duration
+        delta = value - self.mean
+        self.mean += delta * duration / self.total_time
+        self._m2 += duration * delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self._m2 / self.total_time if self.total_time > 0 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+
+class P2Quantile:
+    """
+    Estimates the p-quantile of a stream of observations with the P^2 algorithm
+    (R. Jain and I. Chlamtac, 1985): only five markers are kept, whose heights
+    are adjusted with a piecewise-parabolic interpolation at each observation,
+    so memory and time per observation are O(1).
+    """
+
+    def __init__(self, p):
+        self.p = p
+        self.count = 0
+        self._heights = []  # marker heights, q_0 .. q_4
+        self._positions = [0, 1, 2, 3, 4]  # actual marker positions
+        self._desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]  # desired marker positions
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, value):
+        self.count += 1
+        q = self._heights
+        if self.count <= 5:
+            q.append(value)
+            if self.count == 5:
+                q.sort()
+            return
+
+        # find the cell k such that q[k] <= value < q[k + 1], extending the extremes if needed
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[k + 1]:
+                k += 1
+
+        n = self._positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        desired = self._desired
+        for i in range(5):
+            desired[i] += self._increments[i]
+
+        # adjust the heights of the three middle markers, if they are off their desired position
+        for i in (1, 2, 3):
+            d = desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = height
+                n[i] += d
+
+    def _parabolic(self, i, d):
+        q = self._heights
+        n = self._positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+                (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+                + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    @property
+    def value(self):
+        if self.count >= 5:
+            return self._heights[2]
+        if self.count == 0:
+            return 0.0
+        # too few observations for the markers: quantile of the sorted sample
+        return sorted(self._heights)[min(int(self.p * self.count), self.count - 1)]
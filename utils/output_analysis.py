@@ -0,0 +1,375 @@
+import math
+from collections import deque
+
+import numpy as np
+from scipy.stats import t
+
+
+def compute_confidence_intervals(samples, confidence_level):
+    """
+    Student-t confidence intervals of the mean of several metrics at once.
+    'samples' is a 2D array-like with one row per observation (e.g. per
+    replication) and one column per metric.
+    Returns the arrays of the means, of the lower and of the upper bounds.
+    """
+    samples = np.asarray(samples, dtype=float)
+    sample_size = samples.shape[0]
+    if sample_size < 2:
+        raise ValueError("Il campione deve avere almeno due elementi per calcolare l'intervallo di confidenza.")
+
+    sample_mean = samples.mean(axis=0)
+    standard_error = samples.std(axis=0, ddof=1) / np.sqrt(sample_size)
+    degrees_of_freedom = sample_size - 1
+
+    t_value = t.ppf((1 + confidence_level) / 2, degrees_of_freedom)
+    margin_of_error = t_value * standard_error
+
+    return sample_mean, sample_mean - margin_of_error, sample_mean + margin_of_error
+
+
+def compute_confidence_interval(sample, confidence_level):
+    """
+    Student-t confidence interval of the mean of a single sample.
+    Returns the mean, the lower and the upper bound.
+    """
+    sample_mean, lower, upper = compute_confidence_intervals(np.asarray(sample, dtype=float)[:, np.newaxis],
+                                                             confidence_level)
+    return sample_mean[0].item(), lower[0].item(), upper[0].item()
+
+
+def paired_confidence_interval(sample, reference, confidence_level):
+    """
+    Confidence interval of the mean difference between two samples paired
+    observation by observation (e.g. the replications of two configurations
+    run with the same seeds and common random numbers). When the pairs are
+    positively correlated, it is much narrower than the one of the difference
+    of two independent samples.
+    Returns the mean difference, the lower and the upper bound.
+    """
+    differences = np.asarray(sample, dtype=float) - np.asarray(reference, dtype=float)
+    return compute_confidence_interval(differences, confidence_level)
+
+
+def summarize_replications(results, confidence_level):
+    """
+    Given the list of the metrics dictionaries of independent replications
+    (e.g. the ones of lab2.overall_metrics), returns a dictionary with the
+    mean and the confidence interval of each numeric metric, computed for all
+    of them at once. Metrics which are not a number in every replication
+    (e.g. "N/A") are left out.
+    """
+    fields = [field for field in results[0]
+              if all(isinstance(result[field], (int, float)) for result in results)]
+    samples = [[result[field] for field in fields] for result in results]
+    means, lowers, uppers = compute_confidence_intervals(samples, confidence_level)
+    return {field: {'Mean': mean, 'CI Lower': lower, 'CI Upper': upper}
+            for field, mean, lower, upper in zip(fields, means.tolist(), lowers.tolist(), uppers.tolist())}
+
+
+def mser5_truncation(series, batch_size=5):
+    """
+    Warm-up truncation point of a series of observations, with the MSER-5
+    rule (K. P. White, 1997): the series is averaged in batches of
+    'batch_size' (5) observations, z_1 .. z_m, and the number d of initial
+    batches to discard is the one minimizing
+        MSER(d) = sum over i > d of (z_i - mean(z_d+1 .. z_m))^2 / (m - d)^2
+    i.e. the trade-off between the bias of the warm-up and the variance of a
+    shorter series. d is searched in the first half of the series, and all
+    the MSER(d) are computed at once with suffix sums, so it is O(n).
+    Returns the number of observations to discard.
+    """
+    series = np.asarray(series, dtype=float)
+    m = len(series) // batch_size
+    if m < 2:
+        return 0
+    z = series[:m * batch_size].reshape(m, batch_size).mean(axis=1)
+    suffix_sum = np.cumsum(z[::-1])[::-1]
+    suffix_squares = np.cumsum((z * z)[::-1])[::-1]
+    remaining = m - np.arange(m)
+    mser = (suffix_squares - suffix_sum ** 2 / remaining) / remaining ** 2
+    return int(np.argmin(mser[:m // 2 + 1])) * batch_size
+
+
+class BatchMeans:
+    """
+    Streaming non-overlapping batch means of a ratio estimator, sum(numerators) /
+    sum(denominators) (e.g. total delay / departures, or losses / arrivals;
+    use denominator=1 for a plain mean).
+    Observations are grouped in batches of 'batch_size' observations, and at
+    most 2 * n_batches batches are kept: when they are all complete, adjacent
+    batches are merged and the batch size doubles. So the memory is constant,
+    and the batches grow as long as the run, making them less and less
+    correlated.
+    """
+
+    def __init__(self, n_batches=32):
+        self.n_batches = n_batches
+        self.batch_size = 1
+        self.count = 0
+        self._numerators = []  # complete batches
+        self._denominators = []
+        self._numerator = 0.0  # batch being filled
+        self._denominator = 0.0
+        self._filled = 0
+
+    def add(self, numerator, denominator=1):
+        self.count += 1
+        self._numerator += numerator
+        self._denominator += denominator
+        self._filled += 1
+        if self._filled == self.batch_size:
+            self._numerators.append(self._numerator)
+            self._denominators.append(self._denominator)
+            self._numerator = self._denominator = 0.0
+            self._filled = 0
+            if len(self._numerators) == 2 * self.n_batches:
+                self._numerators = [a + b for a, b in zip(self._numerators[::2], self._numerators[1::2])]
+                self._denominators = [a + b for a, b in zip(self._denominators[::2], self._denominators[1::2])]
+                self.batch_size *= 2
+
+    @property
+    def mean(self):
+        denominator = sum(self._denominators) + self._denominator
+        return (sum(self._numerators) + self._numerator) / denominator if denominator > 0 else 0.0
+
+    def half_width(self, confidence_level):
+        """
+        Half-width of the confidence interval of the mean, computed on the
+        complete batches (inf while there are less than n_batches of them).
+        """
+        numerators = np.array(self._numerators)
+        denominators = np.array(self._denominators)
+        valid = denominators > 0
+        if np.count_nonzero(valid) < self.n_batches:
+            return float('inf')
+        _, lower, upper = compute_confidence_intervals((numerators[valid] / denominators[valid])[:, np.newaxis],
+                                                       confidence_level)
+        return (upper[0] - lower[0]).item() / 2
+
+    def relative_half_width(self, confidence_level):
+        mean = self.mean
+        return self.half_width(confidence_level) / abs(mean) if mean != 0 else float('inf')
+
+
+class SequentialStopping:
+    """
+    Stopping rule of a simulation: the metric is observed every 'check_every'
+    events (each observation being the increments of its counters since the
+    previous one), and the simulation can stop as soon as the relative
+    half-width of its batch means confidence interval is below
+    'relative_precision', but not before 'min_events' events: the interval
+    is computed as soon as there are n_batches batches (32000 events with
+    the defaults), when they can still be too short, and correlated, for it
+    to be reliable (e.g. in a queue close to saturation).
+    The metrics are ratios of the counters of a Measurement, see METRICS.
+    """
+
+    METRICS = {
+        'delay': ('delay', 'departures'),
+        'loss_probability': ('losses', 'arrivals')
+    }
+
+    def __init__(self, metric='delay', relative_precision=0.05, confidence_level=0.95, check_every=1000,
+                 n_batches=32, min_events=200000):
+        self.metric = metric
+        self.relative_precision = relative_precision
+        self.confidence_level = confidence_level
+        self.check_every = check_every
+        self.min_events = min_events
+        self.batch_means = BatchMeans(n_batches)
+        self.satisfied = False
+        self._counters = self.METRICS[metric]
+        self._previous = (0, 0)
+
+    def update(self, data):
+        """
+        Observes the counters of 'data' (a Measurement), and returns True if
+        the target precision has been reached.
+        """
+        numerator = getattr(data, self._counters[0])
+        denominator = getattr(data, self._counters[1])
+        self.batch_means.add(numerator - self._previous[0], denominator - self._previous[1])
+        self._previous = (numerator, denominator)
+        self.satisfied = (self.batch_means.count * self.check_every >= self.min_events
+                          and self.achieved_precision <= self.relative_precision)
+        return self.satisfied
+
+    @property
+    def estimate(self):
+        return self.batch_means.mean
+
+    @property
+    def achieved_precision(self):
+        return self.batch_means.relative_half_width(self.confidence_level)
+
+    def report(self, events):
+        return '{:s}: {:.4f} +/- {:.2f}% ({:.0f}% confidence) after {:d} events{:s}'.format(
+            self.metric, self.estimate, self.achieved_precision * 100, self.confidence_level * 100, events,
+            '' if self.satisfied else ' - target precision of {:.2f}% not reached'.format(
+                self.relative_precision * 100))
+
+
+class _MeanVarianceEstimator:
+    """
+    Common part of the estimators of the variance of the mean of a single
+    (long, correlated) series of observations: the confidence interval is a
+    Student-t one on variance_of_mean, with degrees_of_freedom.
+    """
+
+    @property
+    def mean(self):
+        return self._shift + self._sum / self.count if self.count > 0 else 0.0
+
+    def half_width(self, confidence_level):
+        """
+        Half-width of the confidence interval of the mean (inf while there
+        are not enough observations).
+        """
+        degrees_of_freedom = self.degrees_of_freedom
+        if degrees_of_freedom < 1:
+            return float('inf')
+        return t.ppf((1 + confidence_level) / 2, degrees_of_freedom).item() * math.sqrt(self.variance_of_mean)
+
+    def relative_half_width(self, confidence_level):
+        mean = self.mean
+        return self.half_width(confidence_level) / abs(mean) if mean != 0 else float('inf')
+
+
+class OverlappingBatchMeans(_MeanVarianceEstimator):
+    """
+    Streaming overlapping batch means (Meketon and Schmeiser, 1984): the means
+    of all the windows of 'batch_size' consecutive observations are computed
+    with a sliding window, and only their sum and sum of squares are kept, so
+    the memory is O(batch_size). For the same batch size, its variance is
+    about 2/3 of the one of non-overlapping batch means (see BatchMeans).
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.count = 0
+        self._shift = 0.0  # first observation, subtracted from all of them for numerical stability
+        self._sum = 0.0
+        self._window = deque()
+        self._window_sum = 0.0
+        self._batches = 0
+        self._batch_sum = 0.0  # of the batch means
+        self._batch_squares = 0.0
+
+    def add(self, value):
+        if self.count == 0:
+            self._shift = value
+        value -= self._shift
+        self.count += 1
+        self._sum += value
+        self._window.append(value)
+        self._window_sum += value
+        if len(self._window) > self.batch_size:
+            self._window_sum -= self._window.popleft()
+        if len(self._window) == self.batch_size:
+            batch_mean = self._window_sum / self.batch_size
+            self._batches += 1
+            self._batch_sum += batch_mean
+            self._batch_squares += batch_mean * batch_mean
+
+    @property
+    def variance_of_mean(self):
+        n, b, k = self.count, self.batch_size, self._batches
+        if n <= b:
+            return float('inf')
+        mean = self._sum / n
+        deviations = self._batch_squares - 2 * mean * self._batch_sum + k * mean * mean
+        return max(deviations, 0.0) * b / (k * (n - b))
+
+    @property
+    def degrees_of_freedom(self):
+        return int(1.5 * (self.count / self.batch_size - 1))
+
+
+class SpectralVariance(_MeanVarianceEstimator):
+    """
+    Streaming spectral estimator: the variance of the mean of n observations
+    is S(0) / n, where S(0) is the spectral density of the series at
+    frequency zero, estimated with Welch's method. The series is split in
+    segments of 'segment_length' observations, overlapping by half and
+    weighted with a Hann window, and their periodograms at zero,
+    (sum of w_i * (x_i - mean))^2 / sum of w_i^2, are averaged. Only the
+    weighted sums of the (at most two) open segments are kept.
+    """
+
+    def __init__(self, segment_length=1024):
+        self.segment_length = segment_length
+        self._window = (0.5 - 0.5 * np.cos(2 * np.pi * (np.arange(segment_length) + 0.5) / segment_length)).tolist()
+        self._window_sum = math.fsum(self._window)
+        self._window_squares = math.fsum(w * w for w in self._window)
+        self.count = 0
+        self._shift = 0.0
+        self._sum = 0.0
+        self._open = []  # [observations, weighted sum] of the open segments
+        self._segments = 0
+        self._segment_sum = 0.0  # of the weighted sums of the closed segments
+        self._segment_squares = 0.0
+
+    def add(self, value):
+        if self.count == 0:
+            self._shift = value
+        value -= self._shift
+        if self.count % (self.segment_length // 2) == 0:
+            self._open.append([0, 0.0])
+        self.count += 1
+        self._sum += value
+        for segment in self._open:
+            segment[1] += self._window[segment[0]] * value
+            segment[0] += 1
+        if self._open[0][0] == self.segment_length:
+            weighted_sum = self._open.pop(0)[1]
+            self._segments += 1
+            self._segment_sum += weighted_sum
+            self._segment_squares += weighted_sum * weighted_sum
+
+    @property
+    def variance_of_mean(self):
+        k = self._segments
+        if k == 0:
+            return float('inf')
+        # sum over the segments of (weighted sum - mean * sum of the weights)^2
+        offset = self._sum / self.count * self._window_sum
+        deviations = self._segment_squares - 2 * offset * self._segment_sum + k * offset * offset
+        return max(deviations, 0.0) / (k * self._window_squares) / self.count
+
+    @property
+    def degrees_of_freedom(self):
+        return self._segments - 1
+
+
+class TimeWeightedBins:
+    """
+    Turns a piecewise-constant quantity (e.g. the number of users in the
+    system) into the series of its time averages over consecutive bins of
+    'bin_width' time units, which are passed to estimator.add as soon as they
+    are complete. So the estimators above, which work on series of
+    observations, can be used on time-weighted quantities too.
+    """
+
+    def __init__(self, bin_width, estimator):
+        self.bin_width = bin_width
+        self.estimator = estimator
+        self._time = 0.0
+        self._bins = 0  # complete bins
+        self._bin_end = bin_width
+        self._area = 0.0  # of the bin being filled
+
+    def add(self, value, duration):
+        """
+        Accounts for 'value' having been held for 'duration' time units.
+        """
+        end = self._time + duration
+        while end >= self._bin_end:
+            self._area += value * (self._bin_end - self._time)
+            self.estimator.add(self._area / self.bin_width)
+            self._time = self._bin_end
+            self._bins += 1
+            self._bin_end = (self._bins + 1) * self.bin_width
+            self._area = 0.0
+        if end > self._time:
+            self._area += value * (end - self._time)
+            self._time = end
@@ -1,4 +1,7 @@
+import heapq
+import math
 import random
+from collections import deque
 from enum import Enum
 
 
@@ -10,10 +13,25 @@ class Packet:
 
 class Server:
     def __init__(self, service_time):
-        self.idle = True
+        self._idle = True
         self.service_time = service_time
         self.total_time_engaged = 0.0
         self.selection_count = 0
+        # set by the MMmB owning the server, which is notified when the server changes state
+        self._owner = None
+        self._server_id = None
+        self._in_idle_heap = False
+
+    @property
+    def idle(self):
+        return self._idle
+
+    @idle.setter
+    def idle(self, idle):
+        if idle != self._idle:
+            self._idle = idle
+            if self._owner is not None:
+                self._owner._server_state_changed(self)
 
     def engage(self, service_duration):
         self.idle = False
@@ -61,20 +79,55 @@ class Battery:
 
 class MMmB:
     def __init__(self, power_supply: str, service_times: list[float], buffer_size=0, infinite_buffer=False, maximum_recharge_cycles="inf", working_slots=[[0, 50000]]):
+        # set by the ReadyDroneIndex the drone belongs to, which is notified when the drone may become ready
+        # or stop being ready (see _readiness_changed)
+        self._ready_index = None
+        self._drone_id = None
         self.infinite_buffer = infinite_buffer
         self.buffer_size = buffer_size  # B
         self.battery: Battery = Battery(power_supply)
         self.maximum_recharge_cycles = maximum_recharge_cycles
         self.working_slots = working_slots
-        self._queue: list[Packet] = []
+        self._queue: deque[Packet] = deque()
         self._servers: dict[int, Server] = {i: Server(service_times[i]) for i in range(len(service_times))}
-        self._rr_scheduling: list[int] = list(self._servers.keys())
+        self._n_servers = len(self._servers)
+        self._capacity = sum(service_times)
+        # the busy servers are counted, and the idle ones are kept in a heap keyed by service time,
+        # so that no list over all the servers is built for each packet (see _server_state_changed)
+        self._busy_servers = 0
+        self._idle_heap: list[tuple[float, int]] = []
+        for server_id, server in self._servers.items():
+            server._owner = self
+            server._server_id = server_id
+            server._in_idle_heap = True
+            self._idle_heap.append((server.service_time, server_id))
+        heapq.heapify(self._idle_heap)
+        # the random and round robin policies find the k-th idle server (by id) in a Fenwick tree of the idle
+        # flags, built at their first use (see _get_idle_server)
+        self._idle_tree: list[int] = None
+        self._rr_next = 0  # id from which round robin looks for an idle server
         self._scheduling_policy = self._get_server_fastest
         self.users = 0
+        # incremented at each switch off, to recognize the events scheduled before it
+        self.generation = 0
+
+    @property
+    def maximum_recharge_cycles(self):
+        return self._maximum_recharge_cycles
+
+    @maximum_recharge_cycles.setter
+    def maximum_recharge_cycles(self, maximum_recharge_cycles):
+        self._maximum_recharge_cycles = maximum_recharge_cycles
+        self._readiness_changed()
+
+    def _readiness_changed(self):
+        if self._ready_index is not None:
+            self._ready_index.update(self._drone_id)
 
     def battery_recharge(self):
         self.battery.status = BatteryStatus.FULL
         self.battery.complete_cycles += 1
+        self._readiness_changed()
 
     def battery_consume(self, usage_time):
         self.battery.residual -= usage_time
@@ -82,12 +135,15 @@ class MMmB:
     def switch_on(self, solar_panel=False):
         self.battery.status = BatteryStatus.IN_USE
         self.battery.init_battery(solar_panel=solar_panel)
+        self._readiness_changed()
 
     def switch_off(self, empty_battery=True):
         for server in self._servers.values():
             server.idle = True
         self._queue.clear()
         self.battery.status = BatteryStatus.EMPTY if empty_battery else BatteryStatus.PAUSED
+        self.generation += 1
+        self._readiness_changed()
 
     def insert(self, packet: Packet):
         """
@@ -112,8 +168,64 @@ class MMmB:
     def is_queue_full(self):
         return len(self._queue) == self.buffer_size and not self.infinite_buffer
 
+    def _server_state_changed(self, server: Server):
+        """
+        Called by a server of this MMmB when it becomes idle or busy. An idle server
+        is pushed into the idle heap unless it is already there: entries of servers
+        that became busy are left in the heap, and discarded when they reach the top.
+        """
+        if server.idle:
+            self._busy_servers -= 1
+            if not server._in_idle_heap:
+                server._in_idle_heap = True
+                heapq.heappush(self._idle_heap, (server.service_time, server._server_id))
+        else:
+            self._busy_servers += 1
+        if self._idle_tree is not None:
+            self._update_idle_tree(server._server_id, 1 if server.idle else -1)
+
+    def _update_idle_tree(self, server_id, change):
+        tree = self._idle_tree
+        i = server_id + 1
+        while i < len(tree):
+            tree[i] += change
+            i += i & -i
+
+    def _get_idle_tree(self):
+        if self._idle_tree is None:
+            self._idle_tree = [0] * (self._n_servers + 1)
+            for server_id, server in self._servers.items():
+                if server.idle:
+                    self._update_idle_tree(server_id, 1)
+        return self._idle_tree
+
+    def _get_idle_server(self, k):
+        """
+        Returns the id of the k-th (from 0) idle server, in order of id, in
+        O(log m).
+        """
+        tree = self._get_idle_tree()
+        # descend the tree to the last position preceded by at most k idle servers
+        position = 0
+        bit = 1 << (len(tree) - 1).bit_length()
+        while bit:
+            if position + bit < len(tree) and tree[position + bit] <= k:
+                position += bit
+                k -= tree[position]
+            bit >>= 1
+        return position
+
+    def _count_idle_servers_before(self, server_id):
+        tree = self._get_idle_tree()
+        count = 0
+        i = server_id
+        while i > 0:
+            count += tree[i]
+            i -= i & -i
+        return count
+
     def _get_servers_working(self):
-        return [server.idle for server in self._servers.values()].count(False)
+        return self._busy_servers
 
     def _get_available_servers(self):
         return [k for k, v in self._servers.items() if v.idle]
@@ -122,30 +234,35 @@ class MMmB:
         """
         Determine if any servers are available to start serving a packet.
         """
-        n_servers_w = self._get_servers_working()
+        n_servers_w = self._busy_servers
         if self.buffer_size == 0:
             # Se non c'è buffer, controlla semplicemente se esiste un server libero
-            return n_servers_w < len(self._servers)
+            return n_servers_w < self._n_servers
         else:
             # Se c'è un buffer, controlla sia la disponibilità del server che lo spazio nel buffer
-            return n_servers_w < len(self._servers) and n_servers_w < self.queue_size()
+            return n_servers_w < self._n_servers and n_servers_w < len(self._queue)
 
     def _get_server_random(self):
-        return random.choice(self._get_available_servers())
+        # same draw as random.choice(self._get_available_servers()), without building the list
+        return self._get_idle_server(random.randrange(self._n_servers - self._busy_servers))
 
     def _get_server_fastest(self):
-        return min(self._get_available_servers(), key=lambda k: self._servers[k].service_time)
+        # idle server with the lowest service time (ties broken by id), discarding the busy ones on top
+        idle_heap = self._idle_heap
+        servers = self._servers
+        while not servers[idle_heap[0][1]].idle:
+            servers[heapq.heappop(idle_heap)[1]]._in_idle_heap = False
+        return idle_heap[0][1]
 
     def _get_server_roundrobin(self):
-        s_id = self._rr_scheduling.pop(0)
-        while not self._servers[s_id].idle:
-            self._rr_scheduling.append(s_id)
-            s_id = self._rr_scheduling.pop(0)
-        self._rr_scheduling.append(s_id)
+        # first idle server from _rr_next on or, if there's none, the first idle one
+        idle_before = self._count_idle_servers_before(self._rr_next)
+        s_id = self._get_idle_server(idle_before if idle_before < self._n_servers - self._busy_servers else 0)
+        self._rr_next = (s_id + 1) % self._n_servers
         return s_id
 
     def get_capacity(self):
-        return sum(map(lambda server: server.service_time, self._servers.values()))
+        return self._capacity
 
     def engage_server(self):
         assert self.can_engage_server()
@@ -154,10 +271,10 @@ class MMmB:
         return server_id, self._servers[server_id].service_time
 
     def consume(self, server_id):
-        assert self._get_servers_working() > 0
-        if self.queue_size() > 0:
+        assert self._busy_servers > 0
+        if self._queue:
             self._servers[server_id].idle = True
-            return self._queue.pop(0)
+            return self._queue.popleft()
         else:
             raise IndexError("Attempted to consume from an empty queue")
 
@@ -179,3 +296,96 @@ class MMmB:
             assert isinstance(self.maximum_recharge_cycles, int)
             return self.battery.complete_cycles >= self.maximum_recharge_cycles
         return False
+
+
+class ReadyDroneIndex:
+    """
+    Index of the drones of a fleet which are ready to be sent: battery paused
+    or full, within one of their working slots, and below their maximum
+    number of recharge cycles. The order by decreasing capacity (in the order
+    of the fleet, for equal capacities) doesn't change, so each drone gets its
+    rank once, and the ready ones are flagged in a Fenwick tree over the
+    ranks: a drone is added or removed, and the k-th ready one is found, in
+    O(log n), without filtering and sorting the whole fleet.
+    The drones notify the index when their battery changes state, or their
+    maximum number of recharge cycles is changed (see
+    MMmB._readiness_changed), while the boundaries of the working slots, kept
+    in a heap, are applied in time order by advance: times must not decrease.
+    The fleet must not change after the index is built (a new index is needed
+    when drones are added or replaced).
+    """
+
+    def __init__(self, drones: dict):
+        self._drones = drones
+        self._ids = list(drones.keys())
+        self._in_slot = {}  # number of working slots each drone is in
+        self._boundaries = []  # (time, position, +1 entering a slot / -1 leaving it)
+        for position, (drone_id, drone) in enumerate(drones.items()):
+            self._in_slot[drone_id] = 0
+            drone._ready_index = self
+            drone._drone_id = drone_id
+            for start, end in drone.working_slots:
+                # the slot includes its end, so the drone leaves it just after
+                self._boundaries.append((start, position, 1))
+                self._boundaries.append((math.nextafter(end, math.inf), position, -1))
+        heapq.heapify(self._boundaries)
+        # drones in order of decreasing capacity, and rank (1-based) of each of them
+        self._ranked = sorted(self._ids, key=lambda drone_id: -drones[drone_id].get_capacity())
+        self._rank = {drone_id: rank for rank, drone_id in enumerate(self._ranked, start=1)}
+        self._ready = set()
+        self._tree = [0] * (len(self._ranked) + 1)  # Fenwick tree of the ready flags, by rank
+        self._top_bit = 1 << (len(self._ranked).bit_length() - 1) if self._ranked else 0
+
+    def advance(self, time):
+        """
+        Applies the boundaries of the working slots up to 'time' (included).
+        """
+        boundaries = self._boundaries
+        while boundaries and boundaries[0][0] <= time:
+            _, position, change = heapq.heappop(boundaries)
+            drone_id = self._ids[position]
+            self._in_slot[drone_id] += change
+            self.update(drone_id)
+
+    def update(self, drone_id):
+        drone = self._drones[drone_id]
+        ready = (self._in_slot[drone_id] > 0
+                 and drone.battery.status in (BatteryStatus.PAUSED, BatteryStatus.FULL)
+                 and not drone.has_exceeded_max_complete_cycles())
+        indexed = drone_id in self._ready
+        if ready == indexed:
+            return
+        if ready:
+            self._ready.add(drone_id)
+            change = 1
+        else:
+            self._ready.discard(drone_id)
+            change = -1
+        tree = self._tree
+        rank = self._rank[drone_id]
+        while rank < len(tree):
+            tree[rank] += change
+            rank += rank & -rank
+
+    def __len__(self):
+        return len(self._ready)
+
+    def select(self, fraction):
+        """
+        Returns the id of the ready drone at 'fraction' (in [0, 1]) of the
+        ordered ready drones, the first one having the highest capacity, or None if no
+        drone is ready.
+        """
+        if not self._ready:
+            return None
+        # descend the tree to the last rank preceded by fewer than k ready drones
+        k = int((len(self._ready) - 1) * fraction) + 1
+        tree = self._tree
+        rank = 0
+        bit = self._top_bit
+        while bit:
+            if rank + bit < len(tree) and tree[rank + bit] < k:
+                rank += bit
+                k -= tree[rank]
+            bit >>= 1
+        return self._ranked[rank]
@@ -0,0 +1,108 @@
+from itertools import islice
+
+import numpy as np
+
+# Number of variates drawn at once by each buffer of a RandomStream
+BLOCK_SIZE = 65536
+
+
+class RandomStream:
+    """
+    Adapter exposing a numpy.random.Generator with the methods of the
+    'random' module used by the simulations (expovariate, choice, ...), so
+    that it can be used as the random generator of a simulation.
+    Streams spawned from the same SeedSequence (see spawn_streams) are
+    statistically independent, unlike the ones obtained by seeding the
+    Mersenne Twister of 'random' with consecutive seeds.
+
+    The variates are not drawn one at a time: each distribution has a buffer
+    of standard variates (exponential with rate 1, uniform in [0, 1), normal
+    with mean 0 and variance 1, gamma with scale 1 for each shape), filled
+    with 'block_size' values at once by NumPy and then scaled at each call.
+    The sequence of the returned values only depends on the seed and on the
+    sequence of the calls, so the simulations stay reproducible.
+    """
+
+    def __init__(self, seed=None, block_size=BLOCK_SIZE):
+        self.block_size = block_size
+        self.seed(seed)
+
+    def seed(self, seed=None):
+        """
+        'seed' is either an int or a numpy.random.SeedSequence.
+        The buffered variates are discarded.
+        """
+        self._generator = np.random.default_rng(seed)
+        empty = iter(())
+        self._exponential = empty
+        self._uniform = empty
+        self._normal = empty
+        self._gamma = {}
+
+    @property
+    def generator(self):
+        return self._generator
+
+    def _fill(self, draw, *args):
+        # a list iterator is much faster to consume than indexing a NumPy array
+        return iter(draw(*args, size=self.block_size).tolist())
+
+    def random(self):
+        try:
+            return next(self._uniform)
+        except StopIteration:
+            self._uniform = self._fill(self._generator.random)
+            return next(self._uniform)
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def choice(self, seq):
+        try:
+            return seq[int(next(self._uniform) * len(seq))]
+        except StopIteration:
+            self._uniform = self._fill(self._generator.random)
+            return seq[int(next(self._uniform) * len(seq))]
+
+    def expovariate(self, lambd=1.0):
+        try:
+            return next(self._exponential) / lambd
+        except StopIteration:
+            self._exponential = self._fill(self._generator.standard_exponential)
+            return next(self._exponential) / lambd
+
+    def exponentials(self, n):
+        """
+        Returns, as a NumPy array, the next 'n' standard exponential variates:
+        the values that n calls of expovariate(1.0) would return, taken from
+        the buffer without a Python call for each of them.
+        """
+        values = np.fromiter(islice(self._exponential, n), dtype=float)
+        while len(values) < n:
+            self._exponential = self._fill(self._generator.standard_exponential)
+            values = np.concatenate((values, np.fromiter(islice(self._exponential, n - len(values)), dtype=float)))
+        return values
+
+    def gauss(self, mu=0.0, sigma=1.0):
+        try:
+            return mu + sigma * next(self._normal)
+        except StopIteration:
+            self._normal = self._fill(self._generator.standard_normal)
+            return mu + sigma * next(self._normal)
+
+    normalvariate = gauss
+
+    def gammavariate(self, alpha, beta):
+        try:
+            return beta * next(self._gamma[alpha])
+        except (KeyError, StopIteration):
+            self._gamma[alpha] = self._fill(self._generator.standard_gamma, alpha)
+            return beta * next(self._gamma[alpha])
+
+
+def spawn_streams(seed, n_streams, block_size=BLOCK_SIZE):
+    """
+    Returns 'n_streams' independent RandomStreams, spawned from
+    SeedSequence(seed).
+    """
+    return [RandomStream(child, block_size) for child in np.random.SeedSequence(seed).spawn(n_streams)]